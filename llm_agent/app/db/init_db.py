@@ -1,5 +1,6 @@
 from app.db.database import engine
 from app.db.models import Base
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -14,3 +14,35 @@ class Workflow(Base):
     workflow_json = Column(JSON, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class WorkflowCache(Base):
+    __tablename__ = "workflow_cache"
+
+    input_hash = Column(String(64), primary_key=True)
+    prompt_version = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    workflow_json = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class SemanticCache(Base):
+    __tablename__ = "semantic_cache"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    prompt = Column(Text, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    embedding = Column(JSON, nullable=False)
+    workflow_json = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class LLMResponseCache(Base):
+    __tablename__ = "llm_response_cache"
+
+    cache_key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+import logging
+from fastapi import FastAPI, HTTPException, BackgroundTasks
 from app.services.ai_service import generate_workflow
 from app.db.database import SessionLocal
 from app.db.models import Workflow
@@ -10,7 +10,7 @@ from app.db.init_db import init_db
 # Lifespan handler to initialize DB at startup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    await init_db()
     yield 
 
 app = FastAPI(title="AI Task Architect", lifespan=lifespan)
@@ -21,28 +21,23 @@ class PromptRequest(BaseModel):
     prompt: str
 
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
+# Persist a generated workflow after the response is sent (own short-lived session)
+async def _persist(result: dict, prompt: str) -> None:
     try:
-        yield db
-    finally:
-        db.close()
+        async with SessionLocal() as db:
+            db.add(Workflow(name=result["name"], prompt=prompt, workflow_json=result))
+            await db.commit()
+    except Exception as e:
+        # Errors no longer reach the client, so make sure they are visible in the logs
+        logging.exception(f"Failed to persist workflow '{result.get('name')}': {e}")
 
 
-# POST /generate → returns and saves generated workflow
+# POST /generate → returns generated workflow, saves it in the background
 @app.post("/generate")
-async def generate(request: PromptRequest, db: Session = Depends(get_db)):
+async def generate(request: PromptRequest, background_tasks: BackgroundTasks):
     try:
-        result = generate_workflow(request.prompt)
-        workflow = Workflow(
-            name=result["name"],
-            prompt=request.prompt,
-            workflow_json=result
-        )
-        db.add(workflow)
-        db.commit()
-        db.refresh(workflow)
+        result = await generate_workflow(request.prompt)
+        background_tasks.add_task(_persist, result, request.prompt)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Optional
 
 class Step(BaseModel):
     type: str
@@ -11,3 +12,61 @@ class Step(BaseModel):
 class WorkflowSchema(BaseModel):
     trigger: str
     steps: List[Step]
+
+class N8nWorkflowSchema(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    name: str = Field(min_length=1)
+    nodes: List[Dict[str, Any]] = Field(min_length=1)
+    connections: Dict[str, Any] = Field(default_factory=dict)
+
+# Strict structured-output shape: node parameters travel as a JSON string and
+# connections as an edge list, since strict schemas cannot express free-form objects
+class StructuredNode(BaseModel):
+    name: str
+    type: str
+    typeVersion: float
+    position: List[int]
+    parameters: str
+
+class StructuredEdge(BaseModel):
+    source: str
+    target: str
+    output: int = 0
+    input: int
+
+class StructuredConnections(BaseModel):
+    connections: List[StructuredEdge]
+
+    def to_n8n(self) -> Dict[str, Any]:
+        """Convert the edge list into n8n's `{source: {"main": [[link, ...], ...]}}` shape."""
+        out: Dict[str, Any] = {}
+        for edge in self.connections:
+            main = out.setdefault(edge.source, {"main": []})["main"]
+            while len(main) <= edge.output:
+                main.append([])
+            main[edge.output].append({"node": edge.target, "type": "main", "index": edge.input})
+        return out
+
+class StructuredWorkflow(StructuredConnections):
+    name: str
+    nodes: List[StructuredNode]
+
+    def to_n8n(self) -> Dict[str, Any]:
+        """Convert the structured payload into importable n8n workflow JSON."""
+        nodes = []
+        for node in self.nodes:
+            try:
+                parameters = orjson.loads(node.parameters) if node.parameters.strip() else {}
+            except orjson.JSONDecodeError:
+                parameters = {}
+            nodes.append(
+                {
+                    "name": node.name,
+                    "type": node.type,
+                    "typeVersion": int(node.typeVersion) if node.typeVersion.is_integer() else node.typeVersion,
+                    "position": node.position,
+                    "parameters": parameters if isinstance(parameters, dict) else {},
+                }
+            )
+        return {"name": self.name, "nodes": nodes, "connections": super().to_n8n()}
@@ -1,15 +1,42 @@
 import os
-import json
+import orjson
+import asyncio
+import hashlib
 import logging
-from typing import Any, Dict, List, Set
-from openai import OpenAI
+import re
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from pydantic import ValidationError
+from app.db.database import engine
+from app.services.cache_service import (
+    MemoryCacheBackend,
+    TieredCache,
+    WorkflowTableBackend,
+    find_similar_workflow,
+    get_cached_completion,
+    prompt_hash,
+    store_cached_completion,
+    store_semantic_workflow,
+)
+from app.services.json_stream import IncrementalJsonParser
+from app.services.rate_limiter import RateLimiter
+from app.schemas.workflow import N8nWorkflowSchema, StructuredConnections, StructuredWorkflow
 
 # ====================================================
 # Environment Setup
 # ====================================================
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def _new_client() -> AsyncOpenAI:
+    # The SDK retries 429s and 5xx with exponential backoff; the rate limiter below keeps those rare
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
+    )
+
+client = _new_client()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,36 +44,285 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 
+# Bump whenever a system prompt changes so cached workflows auto-invalidate
+PROMPT_VERSION = "v3"
+GENERATION_MODEL = "gpt-4o"
+GENERATION_TEMPERATURE = 0  # workflow caching is only safe while generation is deterministic
+AUX_MODEL = "gpt-4o-mini"  # connections, validation, repair, and Code node JS
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# OpenAI enforces RPM/TPM per model, so each model gets its own bucket. Defaults are tier-1
+# limits; override per model with e.g. OPENAI_MAX_RPM_GPT_4O_MINI / OPENAI_MAX_TPM_GPT_4O_MINI
+MODEL_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    GENERATION_MODEL: (500, 30_000),
+    AUX_MODEL: (500, 200_000),
+    EMBEDDING_MODEL: (3_000, 1_000_000),
+}
+
+def _model_limit(model: str, kind: str, default: float) -> float:
+    return float(os.getenv(f"OPENAI_MAX_{kind}_{re.sub(r'[^A-Z0-9]+', '_', model.upper())}", default))
+
+rate_limiters: Dict[str, RateLimiter] = {
+    model: RateLimiter(
+        requests_per_minute=_model_limit(model, "RPM", rpm),
+        tokens_per_minute=_model_limit(model, "TPM", tpm),
+    )
+    for model, (rpm, tpm) in MODEL_RATE_LIMITS.items()
+}
+# Per-workflow fan-out limit for Code node generation
+CODE_NODE_CONCURRENCY = int(os.getenv("CODE_NODE_CONCURRENCY", "10"))
+GENERATION_ATTEMPTS = 3
+
+# Local validation rules (checked before escalating to an LLM)
+LEGACY_CODE_TOKENS = ("$input.item", "$item", "[0].json")
+CODE_NODE_KINDS = frozenset({"code", "function"})
+# Compiled once: a single scan per script instead of one substring search per token
+_STALE_CODE_RE = re.compile("|".join(map(re.escape, ("$json", *LEGACY_CODE_TOKENS))))
+BRANCHING_NODE_KINDS = frozenset({"if", "switch", "merge", "splitinbatches", "comparedatasets"})
+validation_stats = {"fast_path": 0, "escalated": 0}
+# Malformed JSON fixed locally vs. handed to the slow path (AI repair or a feedback retry)
+repair_stats = {"local": 0, "fallback": 0}
+# Strings are matched first and kept verbatim, so only commas outside them are dropped
+_TRAILING_COMMA_RE = re.compile(r'"(?:[^"\\]|\\.)*"|,\s*([}\]])', re.DOTALL)
+# Required top-level keys, used to complete partial workflows locally instead of asking a model
+_WORKFLOW_SKELETON: Dict[str, Any] = {"name": "AI Generated Workflow", "nodes": [], "connections": {}}
+
+# In-flight generations keyed by prompt hash (request coalescing / singleflight)
+_inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+# Cache writes scheduled off the response path; held here so they are not garbage-collected mid-write
+_background_writes: Set["asyncio.Task[None]"] = set()
+
 # ====================================================
-# Function Schema Definition
+# Structured Output Schemas (strict JSON Schema)
 # ====================================================
-n8n_workflow_function: Dict[str, Any] = {
-    "name": "generate_n8n_workflow",
-    "description": (
-        "Convert natural language automation instructions into a valid n8n workflow JSON "
-        "that can be directly imported and executed in n8n. "
-        "Output must include top-level keys: 'name', 'nodes', and 'connections'."
-    ),
+# Strict mode needs closed objects, so node parameters are a JSON-encoded string
+# and connections an edge list; StructuredWorkflow.to_n8n() restores the n8n shape.
+_edge_list_schema: Dict[str, Any] = {
+    "type": "array",
+    "description": "Directed edges between nodes, in execution order.",
+    "items": {
+        "type": "object",
+        "properties": {
+            "source": {"type": "string", "description": "Name of the upstream node."},
+            "target": {"type": "string", "description": "Name of the downstream node."},
+            "output": {
+                "type": "integer",
+                "description": "Output index on the source node (0 unless branching, e.g. IF false = 1).",
+            },
+            "input": {
+                "type": "integer",
+                "description": "Input index on the target node (0 unless it has several, e.g. Merge input 2 = 1).",
+            },
+        },
+        "required": ["source", "target", "output", "input"],
+        "additionalProperties": False,
+    },
+}
+
+n8n_workflow_response_format: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "n8n_workflow",
+        "description": (
+            "A valid n8n workflow that can be directly imported and executed in n8n: "
+            "'name', 'nodes', and 'connections'."
+        ),
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "nodes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "type": {"type": "string", "description": "e.g. n8n-nodes-base.httpRequest"},
+                            "typeVersion": {"type": "number"},
+                            "position": {"type": "array", "items": {"type": "integer"}},
+                            "parameters": {"type": "string", "description": "JSON-encoded node parameters object."},
+                        },
+                        "required": ["name", "type", "typeVersion", "position", "parameters"],
+                        "additionalProperties": False,
+                    },
+                },
+                "connections": _edge_list_schema,
+            },
+            "required": ["name", "nodes", "connections"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+n8n_connections_response_format: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "n8n_connections",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"connections": _edge_list_schema},
+            "required": ["connections"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+code_scripts_function: Dict[str, Any] = {
+    "name": "generate_scripts",
+    "description": "Return JavaScript for each requested n8n Code node, keyed by node name.",
     "parameters": {
         "type": "object",
         "properties": {
-            "name": {"type": "string"},
-            "nodes": {"type": "array", "items": {"type": "object"}},
-            "connections": {"type": "object"},
+            "scripts": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "node": {"type": "string"},
+                        "jsCode": {"type": "string"},
+                    },
+                    "required": ["node", "jsCode"],
+                },
+            },
         },
-        "required": ["name", "nodes"],
+        "required": ["scripts"],
     },
 }
 
 # ====================================================
-# Helper: JSON Repair via AI
+# Immutable Request Fragments (built once, reused per call)
+# ====================================================
+# Static prefix first, variable prompt last: identical leading tokens on every call let
+# OpenAI's automatic prompt caching reuse the prefix (routed by PROMPT_CACHE_KEY)
+SYSTEM_PROMPT_BASE = (
+    "You are an elite n8n automation engineer. "
+    "Generate a runnable, production-grade n8n workflow JSON. "
+    "Ensure full schema compliance and logical node order. "
+    "Code nodes must follow the modern API and be safe."
+)
+PROMPT_CACHE_KEY = f"n8n-gen-{PROMPT_VERSION}"
+_SYS_GEN: Mapping[str, str] = MappingProxyType({"role": "system", "content": SYSTEM_PROMPT_BASE})
+_CODE_SCRIPTS_FUNCTIONS = (code_scripts_function,)
+# Request schemas are serialized and hashed once at import; cache keys use these digests
+# instead of re-serializing the schema per call. Keys are deliberately not sorted: in strict
+# mode property order is the order the model emits fields, so it is part of the schema.
+_SCHEMA_DIGESTS: Dict[int, str] = {
+    id(fragment): hashlib.sha256(orjson.dumps(fragment)).hexdigest()
+    for fragment in (n8n_workflow_response_format, n8n_connections_response_format, _CODE_SCRIPTS_FUNCTIONS)
+}
+_WORKFLOW_SCHEMA_HASH = _SCHEMA_DIGESTS[id(n8n_workflow_response_format)]
+
+# Exact-match workflow cache: in-process LRU/TTL tier in front of the DB table
+workflow_cache = TieredCache(
+    [
+        MemoryCacheBackend(maxsize=1024, ttl=3600),
+        WorkflowTableBackend(GENERATION_MODEL, PROMPT_VERSION),
+    ]
+)
+
+def workflow_cache_key(prompt: str) -> str:
+    """Hash everything that determines the primary generation: model, system prompt, schema, prompt."""
+    payload = {
+        "model": GENERATION_MODEL,
+        "system": SYSTEM_PROMPT_BASE,
+        "schema": _WORKFLOW_SCHEMA_HASH,
+        "prompt": prompt,
+    }
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+# ====================================================
+# Helper: Throttled Chat Completion
+# ====================================================
+async def chat_completion(**kwargs: Any) -> Any:
+    """Issue a chat completion once the model's RPM/TPM budget allows it."""
+    # Rough token estimate (~4 chars per token) of the prompt plus any completion cap
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+    await rate_limiters[kwargs["model"]].acquire(prompt_chars // 4 + kwargs.get("max_tokens", 1000))
+    return await client.chat.completions.create(**kwargs)
+
+async def cached_chat(messages: List[Dict[str, Any]], model: str, **kwargs: Any) -> str:
+    """Return the message content for a chat request, served from the shared cache when possible.
+
+    The key hashes the full request payload (model, messages, and any extra parameters such as
+    response_format), so identical sub-calls across requests never pay for a second GPT call.
+    Structured function-call arguments are returned in place of content when present.
+    """
+    params = {k: _SCHEMA_DIGESTS.get(id(v), v) for k, v in kwargs.items()}
+    payload = orjson.dumps({"model": model, "messages": messages, **params}, option=orjson.OPT_SORT_KEYS)
+    key = hashlib.sha256(payload).hexdigest()
+    cached = await get_cached_completion(key)
+    if cached is not None:
+        logging.info(f"LLM response cache hit ({model}, {key[:12]})")
+        return cached
+
+    response = await chat_completion(model=model, messages=messages, **kwargs)
+    msg = response.choices[0].message
+    fc = msg.function_call
+    content = (fc.arguments if fc else msg.content) or ""
+    if content.strip():
+        await store_cached_completion(key, model, content)
+    return content
+
 # ====================================================
-def repair_json_with_ai(broken_json: str) -> Dict[str, Any]:
-    """Attempt to repair malformed JSON output using GPT."""
+# Helper: JSON Repair (local fast path, then AI)
+# ====================================================
+def repair_json_locally(broken_json: str, array_key: str = "nodes") -> Optional[Any]:
+    """Fix the common trivial breakages (code fences, trailing commas, truncated tail) without a model call.
+
+    Truncated input is recovered only if the `array_key` array was emitted in full, so a
+    cut-off response never silently loses nodes.
+    """
+    text = broken_json.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[-1].rstrip("`").strip()
+    text = _TRAILING_COMMA_RE.sub(lambda m: m.group(1) or m.group(0), text)
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+    parser = IncrementalJsonParser(array_key)
+    parser.feed(text)
+    return parser.snapshot() if parser.array_complete else None
+
+def fill_workflow_skeleton(workflow_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill missing or empty required keys from _WORKFLOW_SKELETON; node defaults come from ensure_valid_workflow."""
+    present = {k: v for k, v in workflow_json.items() if v not in (None, "", [], {})}
+    filled = [k for k, v in _WORKFLOW_SKELETON.items() if v and k not in present]
+    if filled:
+        logging.info(f"Filled {', '.join(filled)} from the local workflow skeleton.")
+    return {**orjson.loads(orjson.dumps(_WORKFLOW_SKELETON)), **present}
+
+def _record_repair(path: str) -> None:
+    repair_stats[path] += 1
+    logging.info(f"JSON repair path: {path} (local {repair_stats['local']}/{sum(repair_stats.values())})")
+
+def parse_structured_workflow(raw: str) -> StructuredWorkflow:
+    """Parse the strict-schema output, trying a local repair before giving up on malformed JSON."""
+    try:
+        return StructuredWorkflow.model_validate_json(raw)
+    except ValidationError as e:
+        repaired = repair_json_locally(raw)
+        if isinstance(repaired, dict):
+            # A tail truncated before the edge list still yields a usable workflow; wiring is inferred later
+            repaired.setdefault("connections", [])
+            try:
+                workflow = StructuredWorkflow.model_validate(repaired)
+                _record_repair("local")
+                return workflow
+            except ValidationError:
+                pass
+        _record_repair("fallback")
+        raise e
+
+async def repair_json_with_ai(broken_json: str) -> Optional[Dict[str, Any]]:
+    """Attempt to repair malformed JSON output using GPT; returns None if no usable workflow comes back."""
     try:
         logging.warning("Attempting AI-assisted JSON repair...")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        content = await cached_chat(
+            model=AUX_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -59,53 +335,72 @@ def repair_json_with_ai(broken_json: str) -> Dict[str, Any]:
                 {"role": "user", "content": broken_json},
             ],
         )
-        content = getattr(response.choices[0].message, "content", None)
         if not content or not content.strip():
             raise ValueError("No content returned during JSON repair.")
-        return json.loads(content.strip())
+        repaired = fill_workflow_skeleton(orjson.loads(content.strip()))
+        # The skeleton fills in an empty node list, so an unusable repair still has to be rejected here
+        N8nWorkflowSchema.model_validate(repaired)
+        return repaired
     except Exception as e:
         logging.error(f"JSON repair failed: {e}")
-        # last-resort minimal scaffold
-        return {"name": "AI Generated Workflow", "nodes": [], "connections": {}}
+        return None
+
+# ====================================================
+# Prompt Embeddings (Semantic Cache)
+# ====================================================
+async def embed_prompt(prompt: str) -> List[float]:
+    """Embed a prompt for semantic cache lookups; returns [] on failure."""
+    try:
+        await rate_limiters[EMBEDDING_MODEL].acquire(len(prompt) // 4 + 1)
+        response = await client.embeddings.create(model=EMBEDDING_MODEL, input=prompt)
+        return list(response.data[0].embedding)
+    except Exception as e:
+        logging.warning(f"Prompt embedding failed: {e}")
+        return []
 
 # ====================================================
 # Node Ordering (Triggers First)
 # ====================================================
+TRIGGER_TOKENS = frozenset({"cron", "webhook", "schedule", "trigger"})
+
 def reorder_nodes_for_triggers(nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Ensure trigger nodes appear first in the workflow sequence."""
-    triggers = [
-        n
-        for n in nodes
-        if any(x in n.get("type", "").lower() for x in ["cron", "webhook", "schedule", "trigger"])
-    ]
-    others = [n for n in nodes if n not in triggers]
+    triggers: List[Dict[str, Any]] = []
+    others: List[Dict[str, Any]] = []
+    for n in nodes:
+        node_type = n.get("type", "").lower()
+        (triggers if any(t in node_type for t in TRIGGER_TOKENS) else others).append(n)
     return triggers + others
 
 # ====================================================
 # Connection Inference via AI
 # ====================================================
-def generate_connections_with_ai(prompt: str, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+async def generate_connections_with_ai(prompt: str, nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Ask GPT to infer logical node connections."""
     try:
         logging.info("Inferring node connections with AI...")
         node_names = [n["name"] for n in nodes]
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        content = await cached_chat(
+            model=AUX_MODEL,
             messages=[
                 {
                     "role": "system",
                     "content": (
                         "You are an n8n architect. "
-                        "Create a valid 'connections' object linking the provided node list logically. "
-                        "Follow the JSON schema from https://docs.n8n.io. "
-                        "Return JSON only."
+                        "Link the provided node list logically as directed connections "
+                        "between node names, following n8n semantics (https://docs.n8n.io)."
                     ),
                 },
-                {"role": "user", "content": json.dumps({"prompt": prompt, "nodes": node_names}, indent=2)},
+                {
+                    "role": "user",
+                    "content": orjson.dumps({"prompt": prompt, "nodes": node_names}, option=orjson.OPT_INDENT_2).decode(),
+                },
             ],
+            response_format=n8n_connections_response_format,  # type: ignore
         )
-        content = getattr(response.choices[0].message, "content", None)
-        return json.loads(content.strip()) if content and content.strip() else {}
+        if not content or not content.strip():
+            return {}
+        return StructuredConnections.model_validate_json(content).to_n8n()
     except Exception as e:
         logging.warning(f"AI connection reasoning failed: {e}")
         return {}
@@ -113,12 +408,12 @@ def generate_connections_with_ai(prompt: str, nodes: List[Dict[str, Any]]) -> Di
 # ====================================================
 # AI Self-Validation Layer
 # ====================================================
-def validate_with_ai(prompt: str, workflow_json: Dict[str, Any]) -> Dict[str, Any]:
+async def validate_with_ai(prompt: str, workflow_json: Dict[str, Any]) -> Dict[str, Any]:
     """Ask GPT to inspect, modernize, and correct unsafe or incomplete workflow logic."""
     try:
         logging.info("Running AI validation and best-practice correction...")
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        content = await cached_chat(
+            model=AUX_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -131,35 +426,50 @@ def validate_with_ai(prompt: str, workflow_json: Dict[str, Any]) -> Dict[str, An
                         "- Never assume fixed array indexes or shapes without checking.\n"
                         "- All nodes must have valid `parameters`, `typeVersion`, and `position`.\n"
                         "- Do not hardcode example data or placeholder URLs.\n"
-                        "Return only corrected JSON, no explanations."
+                        "Return the full corrected workflow."
                     ),
                 },
-                {"role": "user", "content": json.dumps({"prompt": prompt, "workflow": workflow_json}, indent=2)},
+                {
+                    "role": "user",
+                    "content": orjson.dumps({"prompt": prompt, "workflow": workflow_json}, option=orjson.OPT_INDENT_2).decode(),
+                },
             ],
+            response_format=n8n_workflow_response_format,  # type: ignore
         )
-        content = getattr(response.choices[0].message, "content", "") or ""
         content = content.strip()
         if not content:
             raise ValueError("Validation model returned empty content.")
         try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            logging.warning("AI validation returned non-JSON. Attempting repair...")
-            return repair_json_with_ai(content)
+            # Keep metadata (id, settings, tags, ...) the structured schema does not carry
+            return {**workflow_json, **parse_structured_workflow(content).to_n8n()}
+        except ValidationError:
+            logging.warning("AI validation returned off-schema JSON. Attempting repair...")
+            repaired = await repair_json_with_ai(content)
+            return {**workflow_json, **repaired} if repaired is not None else workflow_json
     except Exception as e:
         logging.warning(f"AI validation failed: {e}")
         return workflow_json
 
+# ====================================================
+# Per-Kind Node Enrichment
+# ====================================================
+def _enrich_http_request(node: Dict[str, Any]) -> None:
+    # Normalize HTTP Request basics (best practice: explicit responseFormat)
+    node["parameters"].setdefault("responseFormat", "json")
+
+# Keyed by node_kind(), so each node costs one dict lookup instead of a substring scan
+NODE_ENRICHERS: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    "httprequest": _enrich_http_request,
+}
+
 # ====================================================
 # Structural Validation Layer
 # ====================================================
-def ensure_valid_workflow(workflow_json: Dict[str, Any], prompt: str) -> Dict[str, Any]:
+async def ensure_valid_workflow(workflow_json: Dict[str, Any], prompt: str) -> Dict[str, Any]:
     """Ensure workflow has all mandatory fields and valid connections."""
-    name = workflow_json.get("name")
-    nodes: List[Dict[str, Any]] = workflow_json.get("nodes", [])
-
-    if not name or not nodes:
-        raise ValueError("Missing required workflow fields: 'name' or 'nodes'")
+    # Same compiled pydantic validator the cache uses on recall; raises ValidationError (a ValueError)
+    N8nWorkflowSchema.model_validate(workflow_json)
+    nodes: List[Dict[str, Any]] = workflow_json["nodes"]
 
     nodes = reorder_nodes_for_triggers(nodes)
 
@@ -168,14 +478,14 @@ def ensure_valid_workflow(workflow_json: Dict[str, Any], prompt: str) -> Dict[st
         node.setdefault("typeVersion", 1)
         node.setdefault("position", [200 + (i * 220), 300])
 
-        # Normalize HTTP Request basics (best practice: explicit responseFormat)
-        if node.get("type") == "n8n-nodes-base.httpRequest":
-            node["parameters"].setdefault("responseFormat", "json")
+        enrich = NODE_ENRICHERS.get(node_kind(node))
+        if enrich:
+            enrich(node)
 
     workflow_json.update(
         {
             "nodes": nodes,
-            "id": workflow_json.get("id") or f"AI-{abs(hash(prompt)) % 10**8}",
+            "id": workflow_json.get("id") or f"AI-{hashlib.blake2b(prompt.encode(), digest_size=4).hexdigest()}",
             "active": bool(workflow_json.get("active", False)),
             "tags": workflow_json.get("tags", ["ai-generated"]),
             "settings": {
@@ -191,7 +501,11 @@ def ensure_valid_workflow(workflow_json: Dict[str, Any], prompt: str) -> Dict[st
     # Connections
     connections = workflow_json.get("connections", {})
     if not isinstance(connections, dict) or not connections:
-        connections = generate_connections_with_ai(prompt, nodes)
+        # A linear chain is the right wiring unless some node branches or merges
+        if any(node_kind(n) in BRANCHING_NODE_KINDS for n in nodes):
+            connections = await generate_connections_with_ai(prompt, nodes)
+        else:
+            connections = {}
         if not connections:
             node_names = [n["name"] for n in nodes]
             connections = {
@@ -200,71 +514,132 @@ def ensure_valid_workflow(workflow_json: Dict[str, Any], prompt: str) -> Dict[st
             }
             logging.info(f"Fallback sequential connections: {' → '.join(node_names)}")
 
-    # Sanitize connections (remove unknown nodes and simple cycles)
-    connections = sanitize_connections(connections, nodes) # type: ignore
+    # Sanitize connections (remove unknown nodes and cycles)
+    connections = sanitize_connections(connections, nodes)
     workflow_json["connections"] = connections
     return workflow_json
 
 def sanitize_connections(connections: Dict[str, Any], nodes: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Remove edges pointing to unknown nodes and break simple back-edges (cycles)."""
+    """Remove edges pointing to unknown nodes and break cycles by dropping DFS back-edges."""
     valid_names: Set[str] = {n["name"] for n in nodes}
     out: Dict[str, Any] = {}
 
     for src, edges in connections.items():
-        if src not in valid_names:
+        if src not in valid_names or not isinstance(edges, dict):
             continue
-        main = edges.get("main", [])
-        clean_main = []
-        for branch in main:
-            clean_branch = []
-            for link in branch:
-                dst = link.get("node")
-                if dst in valid_names and dst != src:
-                    clean_branch.append(link) # type: ignore
-            if clean_branch:
-                clean_main.append(clean_branch) # type: ignore
+        clean_main = [
+            [link for link in branch if link.get("node") in valid_names and link.get("node") != src]
+            for branch in edges.get("main", [])
+        ]
+        # Keep empty branches in place so output indices (e.g. IF true/false) stay aligned
+        while clean_main and not clean_main[-1]:
+            clean_main.pop()
         if clean_main:
             out[src] = {"main": clean_main}
 
-    # break trivial cycles (A->B and B->A) by removing back edge
-    for src, edges in list(out.items()):
-        for branch in edges.get("main", []):
-            for link in branch:
-                dst = link.get("node")
-                if dst in out:
-                    # does dst link back to src?
-                    for b2 in out[dst].get("main", []):
-                        if any(l2.get("node") == src for l2 in b2):
-                            logging.info(f"Removing back-edge {dst} -> {src} to avoid cycle")
-                            # remove the back edge
-                            out[dst]["main"] = [
-                                [l2 for l2 in bb if l2.get("node") != src] for bb in out[dst]["main"]
-                            ]
+    # Single iterative DFS with WHITE/GRAY/BLACK colouring; an edge into a GRAY node closes a cycle
+    adj: Dict[str, Set[str]] = {
+        src: {link["node"] for branch in edges["main"] for link in branch} for src, edges in out.items()
+    }
+    WHITE, GRAY, BLACK = 0, 1, 2
+    color = dict.fromkeys(valid_names, WHITE)
+    back_edges: Set[Tuple[str, str]] = set()
+
+    # Visit roots in node order (triggers first) so back-edges point toward the trigger side
+    for root in (n["name"] for n in nodes):
+        if color[root] != WHITE:
+            continue
+        color[root] = GRAY
+        stack = [(root, iter(adj.get(root, ())))]
+        while stack:
+            u, children = stack[-1]
+            for v in children:
+                if color[v] == GRAY:
+                    back_edges.add((u, v))
+                elif color[v] == WHITE:
+                    color[v] = GRAY
+                    stack.append((v, iter(adj.get(v, ()))))
+                    break
+            else:
+                color[u] = BLACK
+                stack.pop()
+
+    for u, v in back_edges:
+        logging.info(f"Removing back-edge {u} -> {v} to avoid cycle")
+        main = [[link for link in branch if link["node"] != v] for branch in out[u]["main"]]
+        while main and not main[-1]:
+            main.pop()
+        if main:
+            out[u]["main"] = main
+        else:
+            del out[u]
 
     return out
 
+# ====================================================
+# Local Fast-Path Validation
+# ====================================================
+def node_kind(node: Dict[str, Any]) -> str:
+    """Canonical lower-case node kind, e.g. 'n8n-nodes-base.httpRequest' -> 'httprequest'."""
+    return node.get("type", "").rsplit(".", 1)[-1].lower()
+
+def local_validate(workflow_json: Dict[str, Any]) -> Tuple[bool, List[str]]:
+    """Cheap structural checks; returns (ok, errors) without any LLM call.
+
+    Code node scripts are not checked here: lint_and_modernize_code_nodes regenerates bad ones.
+    """
+    errors: List[str] = []
+    if not workflow_json.get("name"):
+        errors.append("missing workflow 'name'")
+    nodes = workflow_json.get("nodes")
+    if not isinstance(nodes, list) or not nodes:
+        return False, errors + ["missing or empty 'nodes'"]
+
+    names: Set[str] = set()
+    for i, node in enumerate(nodes):
+        name = node.get("name")
+        if not name or not node.get("type"):
+            errors.append(f"node {i} is missing 'name' or 'type'")
+        elif name in names:
+            errors.append(f"duplicate node name '{name}'")
+        names.add(name)
+
+    connections = workflow_json.get("connections", {})
+    if not isinstance(connections, dict):
+        errors.append("'connections' is not an object")
+    elif sanitize_connections(connections, nodes) != connections:
+        errors.append("connections reference unknown nodes, self-loops, or cycles")
+
+    return not errors, errors
+
 # ====================================================
 # Dynamic JavaScript Generator for Code Nodes
 # ====================================================
-def generate_code_node_js(prompt: str, node: Dict[str, Any], prev_node: Dict[str, Any]) -> str:
+# Shared by the single-node and batched generators so both follow the same rules
+CODE_NODE_GUIDELINES = (
+    "Best practices:\n"
+    "- Begin with `const items = $input.all();`\n"
+    "- Safely read/transform `items` based on prior node context\n"
+    "- Prefer functional patterns (map/filter) when appropriate\n"
+    "- Use optional chaining; avoid assumptions about shape\n"
+    "- Never use legacy `$item`, `$node`, `$input.item` or fixed `[0].json` indexes\n"
+    "- End with `return <arrayOfItems>;`\n"
+)
+
+async def generate_code_node_js(prompt: str, node: Dict[str, Any], prev_node: Dict[str, Any]) -> str:
     """Ask GPT to generate clean, context-aware JavaScript for Code nodes."""
     logging.info(f"Generating dynamic JS for Code node '{node.get('name')}' based on prior context...")
     try:
-        prev_context = json.dumps(prev_node.get("parameters", {}), indent=2)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        prev_context = orjson.dumps(prev_node.get("parameters", {}), option=orjson.OPT_INDENT_2).decode()
+        content = await cached_chat(
+            model=AUX_MODEL,
             messages=[
                 {
                     "role": "system",
                     "content": (
                         "You are an expert n8n automation developer. "
                         "Generate only JavaScript code for a modern n8n Code node. "
-                        "Best practices:\n"
-                        "- Begin with `const items = $input.all();`\n"
-                        "- Safely read/transform `items` based on prior node context\n"
-                        "- Prefer functional patterns (map/filter) when appropriate\n"
-                        "- Use optional chaining; avoid assumptions about shape\n"
-                        "- End with `return <arrayOfItems>;`\n"
+                        f"{CODE_NODE_GUIDELINES}"
                         "- Do NOT output markdown or explanations — JS only."
                     ),
                 },
@@ -278,22 +653,66 @@ def generate_code_node_js(prompt: str, node: Dict[str, Any], prev_node: Dict[str
                 },
             ],
         )
-        js_code = getattr(response.choices[0].message, "content", "").strip()
+        js_code = content.strip()
         if not js_code:
             raise ValueError("Empty JS content generated.")
-
-        # Minimal safety rails: ensure it returns items and uses $input.all()
-        if "return" not in js_code or "$input.all()" not in js_code:
-            js_code = (
-                "const items = $input.all();\n"
-                "// Generated fallback: pass-through\n"
-                "return items;"
-            )
-        return js_code
+        return apply_js_safety_rails(js_code)
     except Exception as e:
         logging.warning(f"Dynamic JS generation failed: {e}")
         return "const items = $input.all();\nreturn items;"
 
+async def generate_code_nodes_js_batched(prompt: str, specs: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Generate JavaScript for several Code nodes in one structured GPT call.
+
+    Each spec is `{"name": <node name>, "prev_params": <previous node parameters>}`.
+    Returns a `{node name: jsCode}` mapping; nodes the model skipped are simply absent.
+    """
+    logging.info(f"Generating dynamic JS for {len(specs)} Code node(s) in one batched call...")
+    try:
+        content = await cached_chat(
+            model=AUX_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are an expert n8n automation developer. "
+                        "Generate JavaScript for each listed modern n8n Code node, "
+                        "using the parameters of the node that precedes it as context. "
+                        "Lint and modernize in the same pass: each script replaces one that was "
+                        "empty, held JSON, or used legacy APIs. "
+                        f"{CODE_NODE_GUIDELINES}"
+                        "- Return one script per node, keyed by the exact node name."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": orjson.dumps({"prompt": prompt, "nodes": specs}, option=orjson.OPT_INDENT_2).decode(),
+                },
+            ],
+            functions=_CODE_SCRIPTS_FUNCTIONS,  # type: ignore
+            function_call={"name": "generate_scripts"},
+        )
+        raw_args = content.strip()
+        scripts = orjson.loads(raw_args).get("scripts", []) if raw_args else []
+        return {
+            s["node"]: apply_js_safety_rails(s["jsCode"].strip())
+            for s in scripts
+            if isinstance(s, dict) and s.get("node") and (s.get("jsCode") or "").strip()
+        }
+    except Exception as e:
+        logging.warning(f"Batched JS generation failed: {e}")
+        return {}
+
+def apply_js_safety_rails(js_code: str) -> str:
+    """Minimal safety rails: ensure the script returns items and uses $input.all()."""
+    if "return" not in js_code or "$input.all()" not in js_code:
+        return (
+            "const items = $input.all();\n"
+            "// Generated fallback: pass-through\n"
+            "return items;"
+        )
+    return js_code
+
 # ====================================================
 # Code Node Normalization & Modernization
 # ====================================================
@@ -304,16 +723,31 @@ def looks_like_json_string(s: str) -> bool:
     if not ((s2.startswith("{") and s2.endswith("}")) or (s2.startswith("[") and s2.endswith("]"))):
         return False
     try:
-        json.loads(s2)
+        orjson.loads(s2)
         return True
     except Exception:
         return False
 
-def modernize_code_nodes(workflow_json: Dict[str, Any], prompt: str) -> Dict[str, Any]:
-    """Ensure all Code nodes use modern API and AI-generated JavaScript logic."""
+def code_node_script(params: Dict[str, Any]) -> str:
+    return params.get("jsCode") or params.get("functionCode") or params.get("code") or ""
+
+def script_needs_regeneration(js_code: str) -> bool:
+    """True if a Code node script is empty, holds JSON instead of JavaScript, or uses stale tokens."""
+    return not js_code.strip() or looks_like_json_string(js_code) or bool(_STALE_CODE_RE.search(js_code))
+
+async def lint_and_modernize_code_nodes(
+    workflow_json: Dict[str, Any], prompt: str, stale_scripts: Optional[Dict[str, bool]] = None
+) -> Dict[str, Any]:
+    """Lint every Code node locally, then rewrite all flagged scripts in one batched GPT call.
+
+    `stale_scripts` carries verdicts the stream already reached (node name -> needs fresh JS);
+    those Code nodes are not rescanned.
+    """
     nodes = workflow_json.get("nodes", [])
     updated = False
+    pending: List[int] = []
 
+    # Pass 1: normalize Code nodes and collect the ones that need fresh JS
     for idx, node in enumerate(nodes):
         node_type = node.get("type", "").lower()
         if "function" in node_type or "code" in node_type:
@@ -324,7 +758,7 @@ def modernize_code_nodes(workflow_json: Dict[str, Any], prompt: str) -> Dict[str
 
             params = node.setdefault("parameters", {})
             # Normalize key name to jsCode; migrate from functionCode/code if present
-            js_code = params.get("jsCode") or params.get("functionCode") or params.get("code") or ""
+            js_code = code_node_script(params)
             if "functionCode" in params:
                 del params["functionCode"]
             if "code" in params:
@@ -333,24 +767,52 @@ def modernize_code_nodes(workflow_json: Dict[str, Any], prompt: str) -> Dict[str
             # n8n best practice: set language explicitly
             params.setdefault("language", "JavaScript")
 
-            # If jsCode accidentally contains JSON (e.g., whole workflow dumped), replace via GPT
-            if looks_like_json_string(js_code):
-                logging.info(f"Code node '{node.get('name')}' had JSON in jsCode — regenerating dynamically.")
-                js_code = ""
+            # Empty, JSON-filled (e.g., whole workflow dumped), or legacy scripts get dynamic JS
+            stale = stale_scripts.get(node.get("name")) if stale_scripts and node_kind(node) in CODE_NODE_KINDS else None
+            if stale is None:
+                stale = script_needs_regeneration(js_code)
+            if stale:
+                logging.info(f"Code node '{node.get('name')}' needs fresh JS — regenerating dynamically.")
+                pending.append(idx)
 
-            # If legacy tokens or empty, generate dynamic JS using context
-            legacy = any(t in js_code for t in ["$json", "$input.item", "$item", "[0].json"])
-            if legacy or not js_code.strip():
+            params["jsCode"] = js_code
+            node["parameters"] = params
+
+    # Pass 2: generate JS for all pending nodes in one batched call
+    if pending:
+        specs = [
+            {"name": nodes[idx].get("name"), "prev_params": nodes[idx - 1].get("parameters", {}) if idx > 0 else {}}
+            for idx in pending
+        ]
+        batched = await generate_code_nodes_js_batched(prompt, specs)
+        missing: List[int] = []
+        for idx in pending:
+            js_code = batched.get(nodes[idx].get("name"))
+            if js_code is None:
+                missing.append(idx)
+            else:
+                nodes[idx]["parameters"]["jsCode"] = js_code
+
+        # Fall back to per-node generation (bounded fan-out) for anything the batch skipped
+        if missing:
+            semaphore = asyncio.Semaphore(CODE_NODE_CONCURRENCY)
+
+            async def generate(idx: int) -> str:
                 prev_node = nodes[idx - 1] if idx > 0 else {}
-                js_code = generate_code_node_js(prompt, node, prev_node) # type: ignore
-                updated = True
+                async with semaphore:
+                    return await generate_code_node_js(prompt, nodes[idx], prev_node)
 
-            # Ensure it ends with returning an array
-            if "return" not in js_code:
-                js_code += "\nreturn $input.all();"
+            scripts = await asyncio.gather(*(generate(idx) for idx in missing))
+            for idx, js_code in zip(missing, scripts):
+                nodes[idx]["parameters"]["jsCode"] = js_code
+        updated = True
 
-            params["jsCode"] = js_code
-            node["parameters"] = params
+    # Pass 3: ensure every Code node ends with returning an array
+    for node in nodes:
+        if node.get("type") == "n8n-nodes-base.code":
+            params = node["parameters"]
+            if "return" not in params["jsCode"]:
+                params["jsCode"] += "\nreturn $input.all();"
 
     if updated:
         workflow_json["nodes"] = nodes
@@ -358,97 +820,187 @@ def modernize_code_nodes(workflow_json: Dict[str, Any], prompt: str) -> Dict[str
     return workflow_json
 
 # ====================================================
-# Lint Pass for Code Nodes (optionally round-trip via AI)
+# Post-Processing: AI Correction ∥ Code Node Modernization
 # ====================================================
-def lint_code_nodes(workflow_json: Dict[str, Any], prompt: str) -> Dict[str, Any]:
-    """Detect and auto-refactor legacy or unsafe Code node patterns."""
-    bad_tokens = ("$input.item", "$item", "[0].json")
-    nodes = workflow_json.get("nodes", [])
+async def finalize_workflow(
+    workflow_json: Dict[str, Any], prompt: str, stale_scripts: Optional[Dict[str, bool]] = None
+) -> Dict[str, Any]:
+    """Fix structural problems via AI (only if local checks fail) while Code node JS is generated.
 
-    for node in nodes:
-        node_type = node.get("type", "")
-        if node_type in ("n8n-nodes-base.code", "n8n-nodes-base.function"):
-            code = node.get("parameters", {}).get("jsCode") or node.get("parameters", {}).get("code", "")
-            if looks_like_json_string(code) or any(bad in code for bad in bad_tokens):
-                logging.info("Legacy Code syntax or invalid jsCode detected — sending for AI refactor...")
-                return validate_with_ai(prompt, workflow_json)
-    return workflow_json
+    Code node script problems are left to lint_and_modernize_code_nodes, which regenerates
+    legacy or JSON-filled scripts anyway; only structural errors need validate_with_ai. The two
+    touch disjoint fields, so they run concurrently and the fresh scripts are overlaid afterwards.
+    `stale_scripts` (from the streamed lint) applies only to the nodes as generated, not to the
+    AI-corrected ones.
+    """
+    ok, errors = local_validate(workflow_json)
+    validation_stats["fast_path" if ok else "escalated"] += 1
+    total = validation_stats["fast_path"] + validation_stats["escalated"]
+    logging.info(f"Local validation fast-path ratio: {validation_stats['fast_path']}/{total}")
+    if ok:
+        return await lint_and_modernize_code_nodes(workflow_json, prompt, stale_scripts)
+
+    logging.info(f"Local validation failed ({'; '.join(errors)}) — sending for AI correction...")
+    # lint_and_modernize_code_nodes mutates in place, so the AI correction works on its own copy
+    corrected, modernized = await asyncio.gather(
+        validate_with_ai(prompt, orjson.loads(orjson.dumps(workflow_json))),
+        lint_and_modernize_code_nodes(workflow_json, prompt, stale_scripts),
+    )
+    scripts = {
+        n["name"]: n["parameters"]["jsCode"] for n in modernized["nodes"] if n.get("type") == "n8n-nodes-base.code"
+    }
+    for node in corrected.get("nodes", []):
+        if node.get("name") in scripts and node_kind(node) in CODE_NODE_KINDS:
+            node.setdefault("parameters", {})["jsCode"] = scripts[node["name"]]
+    # Normalizes the corrected nodes; only Code nodes the correction introduced need new JS
+    return await lint_and_modernize_code_nodes(corrected, prompt)
 
 # ====================================================
-# Main Workflow Generator
+# Streamed Primary Generation
 # ====================================================
-def generate_workflow(prompt: str) -> Dict[str, Any]:
-    """Generate an importable, executable n8n workflow dynamically via GPT-4o."""
+def lint_streamed_node(node: Dict[str, Any]) -> Optional[bool]:
+    """Lint a wire-format node as soon as the stream closes it, ahead of the full parse.
+
+    For Code nodes, returns whether the script needs regenerating (None for other kinds).
+    """
     try:
-        logging.info(f"🤖 Generating workflow for prompt: {prompt[:100]}")
+        params = orjson.loads(node.get("parameters") or "{}")
+    except orjson.JSONDecodeError:
+        params = None
+    if not isinstance(params, dict):
+        logging.info(f"Mid-stream lint: node '{node.get('name')}' has unparseable parameters")
+        params = {}  # StructuredWorkflow.to_n8n() drops them the same way
+    if node_kind(node) not in CODE_NODE_KINDS:
+        return None
+    stale = script_needs_regeneration(code_node_script(params))
+    if stale:
+        logging.info(f"Mid-stream lint: Code node '{node.get('name')}' needs fresh JS")
+    return stale
 
-        # Step 1: Generate base workflow
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an elite n8n automation engineer. "
-                        "Generate a runnable, production-grade n8n workflow JSON. "
-                        "Ensure full schema compliance and logical node order. "
-                        "Code nodes must follow the modern API and be safe.\n"
-                        "Return JSON only — no text."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-            functions=[n8n_workflow_function],  # type: ignore
-            function_call={"name": "generate_n8n_workflow"},
-        )
+async def stream_structured_workflow(messages: List[Mapping[str, Any]]) -> Tuple[str, Dict[str, bool]]:
+    """Stream the primary generation; return its raw JSON and the Code node verdicts linted mid-stream."""
+    parser = IncrementalJsonParser("nodes")
+    stale_scripts: Dict[str, bool] = {}
+    stream = await chat_completion(
+        model=GENERATION_MODEL,
+        messages=messages,
+        temperature=GENERATION_TEMPERATURE,
+        response_format=n8n_workflow_response_format,  # type: ignore
+        extra_body={"prompt_cache_key": PROMPT_CACHE_KEY},
+        stream=True,
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if not delta:
+            continue
+        for node in parser.feed(delta):
+            stale = lint_streamed_node(node)
+            if stale is not None:
+                # Duplicate names are resolved conservatively: regenerate if any copy is stale
+                stale_scripts[node.get("name")] = stale_scripts.get(node.get("name"), False) or stale
+    return parser.buffer.strip(), stale_scripts
 
-        fc = getattr(response.choices[0].message, "function_call", None)
-        raw_args = getattr(fc, "arguments", "").strip() if fc else ""
-        if not raw_args:
-            logging.warning("No structured arguments returned. Falling back to raw content.")
-            raw_args = getattr(response.choices[0].message, "content", "").strip()
+# ====================================================
+# Main Workflow Generator
+# ====================================================
+async def _run_generation_pipeline(prompt: str) -> Dict[str, Any]:
+    """Semantic cache lookup, then generate → validate → lint → modernize, then cache the result."""
+    embedding: List[float] = await embed_prompt(prompt) if SEMANTIC_CACHE_ENABLED else []
+    if embedding:
+        similar = await find_similar_workflow(embedding, PROMPT_VERSION)
+        if similar is not None:
+            return similar
 
-        # Step 2: Parse & repair JSON if needed
+    # Steps 1-3: Generate, parse, and validate; on failure, feed the error back and retry
+    messages: List[Mapping[str, Any]] = [_SYS_GEN, {"role": "user", "content": prompt}]
+    for attempt in range(GENERATION_ATTEMPTS):
+        raw_args, stale_scripts = await stream_structured_workflow(messages)
         try:
-            workflow_json = json.loads(raw_args) if raw_args else {}
-        except json.JSONDecodeError:
-            logging.warning("Invalid JSON, invoking repair...")
-            workflow_json = repair_json_with_ai(raw_args or "{}")
+            if not raw_args:
+                raise ValueError("No structured output returned (empty content or refusal).")
+            workflow_json = parse_structured_workflow(raw_args).to_n8n()
+            # Fill empty required keys up front so a single validation pass decides; whatever
+            # still fails (e.g. no nodes) cannot be fixed locally and goes to the feedback retry
+            validated = await ensure_valid_workflow(fill_workflow_skeleton(workflow_json), prompt)
+            break
+        except ValueError as e:  # pydantic's ValidationError is a ValueError
+            if attempt == GENERATION_ATTEMPTS - 1:
+                raise
+            logging.warning(f"Attempt {attempt + 1} produced an invalid workflow ({e}). Retrying with feedback...")
+            if raw_args:
+                messages.append({"role": "assistant", "content": raw_args})
+            messages.append(
+                {"role": "user", "content": f"Your previous output raised {e!r}. Return corrected JSON only."}
+            )
+            await asyncio.sleep(1.0 * (attempt + 1))
 
-        # Step 3: Validate structure
+    # Step 4: Local validation (AI correction only on failure) ∥ Code node modernization
+    enhanced = await finalize_workflow(validated, prompt, stale_scripts)
+    # Post-processing can still degrade the workflow (e.g. a failed AI correction), so only a
+    # result that passes the same schema check the cache applies on recall is stored
+    try:
+        N8nWorkflowSchema.model_validate(enhanced)
+    except ValidationError as e:
+        logging.warning(f"Not caching workflow that failed final validation: {e}")
+        return enhanced
+    # The DB writes happen after the caller has its workflow, not while it waits
+    task = asyncio.create_task(_store_workflow(prompt, embedding, enhanced))
+    _background_writes.add(task)
+    task.add_done_callback(_background_writes.discard)
+
+    return enhanced
+
+async def _store_workflow(prompt: str, embedding: List[float], workflow_json: Dict[str, Any]) -> None:
+    """Write a validated workflow to the exact-match and (if embedded) semantic caches."""
+    if GENERATION_TEMPERATURE == 0:
+        await workflow_cache.set(workflow_cache_key(prompt), workflow_json)
+    if embedding:
+        await store_semantic_workflow(prompt, embedding, PROMPT_VERSION, workflow_json)
+
+async def _generate_singleflight(prompt: str) -> Dict[str, Any]:
+    """Coalesce concurrent identical prompts onto one pipeline run; followers await the leader.
+
+    If the leader is cancelled, its followers are not: one of them takes over as the new leader.
+    """
+    key = prompt_hash(prompt)
+    # No await between lookup and insert, so this check-and-set is atomic on the event loop
+    while (future := _inflight.get(key)) is not None:
+        logging.info("Identical prompt already in flight — awaiting its result.")
         try:
-            validated = ensure_valid_workflow(workflow_json, prompt)
-        except ValueError as ve:
-            logging.warning(f"Structure incomplete ({ve}). Rebuilding via AI...")
-            repair_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an n8n architect. "
-                            "Rebuild a valid workflow JSON including 'name', 'nodes', and 'connections'. "
-                            "Each node must include name, type, parameters, typeVersion, and position. "
-                            "Return JSON only."
-                        ),
-                    },
-                    {"role": "user", "content": json.dumps({"prompt": prompt, "partial": workflow_json}, indent=2)},
-                ],
-            )
-            repair_content = getattr(repair_response.choices[0].message, "content", "") or ""
-            if not repair_content.strip():
-                workflow_json = {"name": "AI Generated Workflow", "nodes": [], "connections": {}}
-            else:
-                try:
-                    workflow_json = json.loads(repair_content.strip())
-                except json.JSONDecodeError:
-                    workflow_json = repair_json_with_ai(repair_content)
-            validated = ensure_valid_workflow(workflow_json, prompt)  # type: ignore
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise  # this follower itself was cancelled
+            logging.info("In-flight leader was cancelled — retrying the generation.")
 
-        # Step 4: AI validation + modernization
-        enhanced = validate_with_ai(prompt, validated)
-        enhanced = lint_code_nodes(enhanced, prompt)
-        enhanced = modernize_code_nodes(enhanced, prompt)
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await _run_generation_pipeline(prompt)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved so a failure with no followers is not reported twice
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+async def generate_workflow(prompt: str) -> Dict[str, Any]:
+    """Generate an importable, executable n8n workflow dynamically via GPT-4o."""
+    try:
+        logging.info(f"🤖 Generating workflow for prompt: {prompt[:100]}")
+
+        deterministic = GENERATION_TEMPERATURE == 0
+        cached = await workflow_cache.get(workflow_cache_key(prompt)) if deterministic else None
+        if cached is not None:
+            logging.info(f"⚡ Workflow cache hit: {cached.get('name', 'Unnamed Workflow')}")
+            return cached
+
+        enhanced = await _generate_singleflight(prompt)
 
         logging.info(f"✅ Workflow generated successfully: {enhanced.get('name', 'Unnamed Workflow')}")
         return enhanced
@@ -456,3 +1008,23 @@ def generate_workflow(prompt: str) -> Dict[str, Any]:
     except Exception as e:
         logging.error(f"Workflow generation failed: {e}")
         raise RuntimeError(f"Workflow generation failed: {e}") from e
+
+def generate_workflow_sync(prompt: str) -> Dict[str, Any]:
+    """Blocking wrapper around generate_workflow for scripts and other non-async callers."""
+
+    async def run() -> Dict[str, Any]:
+        # Pooled HTTP and DB connections are bound to the loop that opened them, and asyncio.run
+        # closes that loop on exit; give this call its own client and release both pools before
+        global client
+        shared, client = client, _new_client()
+        try:
+            result = await generate_workflow(prompt)
+            # asyncio.run cancels leftover tasks on exit, so let the cache writes land first
+            await asyncio.gather(*_background_writes)
+            return result
+        finally:
+            await client.close()
+            client = shared
+            await engine.dispose()
+
+    return asyncio.run(run())
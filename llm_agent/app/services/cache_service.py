@@ -0,0 +1,338 @@
+import hashlib
+import logging
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+from pydantic import ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app.db.database import SessionLocal
+from app.db.models import LLMResponseCache, SemanticCache, WorkflowCache
+from app.schemas.workflow import N8nWorkflowSchema
+
+# ====================================================
+# Cache Settings
+# ====================================================
+WORKFLOW_CACHE_TTL = timedelta(days=7)
+LLM_RESPONSE_CACHE_TTL = timedelta(days=7)
+SEMANTIC_CACHE_MAX_DISTANCE = 0.08  # cosine distance; 0.08 ≈ similarity 0.92
+SEMANTIC_CACHE_TTL = timedelta(days=7)
+# At this cap with 1536-dim embeddings, a SemanticIndex lookup is ~1 ms on the event loop and the
+# matrix rebuild after a write ~15 ms
+SEMANTIC_CACHE_MAX_ENTRIES = 5000
+
+
+def prompt_hash(prompt: str) -> str:
+    """Content address of a prompt (sha256 hex digest)."""
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+# ====================================================
+# Exact-Match Workflow Cache (pluggable backends)
+# ====================================================
+class CacheBackend(Protocol):
+    """Key/value store for validated workflows; Redis or similar can slot in alongside these."""
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None: ...
+
+
+class MemoryCacheBackend:
+    """In-process LRU + TTL cache; hits cost microseconds but die with the process."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = value
+
+
+class WorkflowTableBackend:
+    """The `workflow_cache` table, scoped to one generation model and prompt version."""
+
+    def __init__(self, model: str, prompt_version: str):
+        self.model = model
+        self.prompt_version = prompt_version
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            async with SessionLocal() as db:
+                entry = await db.scalar(
+                    select(WorkflowCache).where(
+                        WorkflowCache.input_hash == key,
+                        WorkflowCache.prompt_version == self.prompt_version,
+                        WorkflowCache.model == self.model,
+                        WorkflowCache.expires_at > datetime.now(timezone.utc),
+                    )
+                )
+                if entry is None:
+                    return None
+
+                # Revalidate on recall; a bad entry is evicted instead of served
+                try:
+                    N8nWorkflowSchema.model_validate(entry.workflow_json)
+                except ValidationError as e:
+                    logging.warning(f"Evicting invalid cached workflow {key[:12]}: {e}")
+                    await db.delete(entry)
+                    await db.commit()
+                    return None
+                return entry.workflow_json
+        except Exception as e:
+            logging.warning(f"Workflow cache lookup failed: {e}")
+            return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        try:
+            async with SessionLocal() as db:
+                await db.merge(
+                    WorkflowCache(
+                        input_hash=key,
+                        prompt_version=self.prompt_version,
+                        model=self.model,
+                        workflow_json=value,
+                        expires_at=datetime.now(timezone.utc) + WORKFLOW_CACHE_TTL,
+                    )
+                )
+                await db.commit()
+        except Exception as e:
+            logging.warning(f"Workflow cache write failed: {e}")
+
+
+class TieredCache:
+    """Read through backends in order (fastest first), backfilling the faster tiers on a hit.
+
+    `stats` counts misses and hits per tier (`hits_<backend class>`), so a restart shows up as
+    hits moving from the memory tier to the persistent one rather than as misses.
+    """
+
+    def __init__(self, backends: List[CacheBackend]):
+        self.backends = backends
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    def _record(self, outcome: str) -> None:
+        self.stats[outcome] = self.stats.get(outcome, 0) + 1
+        lookups = self.stats["hits"] + self.stats["misses"]
+        logging.info(f"Workflow cache {outcome} (hit rate {self.stats['hits']}/{lookups})")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        for i, backend in enumerate(self.backends):
+            value = await backend.get(key)
+            if value is not None:
+                self.stats["hits"] += 1
+                self._record(f"hits_{type(backend).__name__}")
+                for faster in self.backends[:i]:
+                    await faster.set(key, value)
+                return value
+        self._record("misses")
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        # Callers store only validated workflows; the DB tier still revalidates on recall, since
+        # its rows can predate a schema change
+        for backend in self.backends:
+            await backend.set(key, value)
+
+# ====================================================
+# LLM Sub-Call Response Cache
+# ====================================================
+async def get_cached_completion(cache_key: str) -> Optional[str]:
+    """Return the cached message content for a chat request key, or None."""
+    try:
+        async with SessionLocal() as db:
+            entry = await db.scalar(
+                select(LLMResponseCache).where(
+                    LLMResponseCache.cache_key == cache_key,
+                    LLMResponseCache.expires_at > datetime.now(timezone.utc),
+                )
+            )
+            return entry.content if entry is not None else None
+    except Exception as e:
+        logging.warning(f"LLM response cache lookup failed: {e}")
+        return None
+
+
+async def store_cached_completion(cache_key: str, model: str, content: str) -> None:
+    """Upsert a chat response's message content with a fresh expiry."""
+    try:
+        async with SessionLocal() as db:
+            await db.merge(
+                LLMResponseCache(
+                    cache_key=cache_key,
+                    model=model,
+                    content=content,
+                    expires_at=datetime.now(timezone.utc) + LLM_RESPONSE_CACHE_TTL,
+                )
+            )
+            await db.commit()
+    except IntegrityError:
+        # Parallel identical sub-calls race on the same key; the first writer's copy is equivalent
+        logging.debug(f"LLM response cache entry {cache_key[:12]} already stored concurrently")
+    except Exception as e:
+        logging.warning(f"LLM response cache write failed: {e}")
+
+# ====================================================
+# Semantic (Embedding) Workflow Cache
+# ====================================================
+class SemanticIndex:
+    """In-process mirror of the live `semantic_cache` rows, kept in LRU order (least recently hit first).
+
+    Unit embeddings are stacked into one float32 matrix, so a lookup is a single mat-vec product
+    and argmax. The matrix is rebuilt lazily after entries are added or removed, not per lookup.
+    """
+
+    def __init__(self) -> None:
+        # row id -> (prompt_version, unit embedding, workflow, expires_at)
+        self.entries: "OrderedDict[str, Tuple[str, np.ndarray, Dict[str, Any], datetime]]" = OrderedDict()
+        self._ids: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._versions = np.empty(0, dtype=object)
+        self._expires = np.empty(0)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(
+        self, entry_id: str, prompt_version: str, embedding: List[float], workflow_json: Dict[str, Any], expires_at: datetime
+    ) -> None:
+        self.entries[entry_id] = (prompt_version, _normalize(embedding), workflow_json, expires_at)
+        self._matrix = None
+
+    def remove(self, entry_ids: List[str]) -> None:
+        for entry_id in entry_ids:
+            self.entries.pop(entry_id, None)
+        self._matrix = None
+
+    def touch(self, entry_id: str) -> None:
+        self.entries.move_to_end(entry_id)
+
+    def evict_overflow(self, max_entries: int) -> List[str]:
+        """Drop least recently hit entries beyond `max_entries`; returns their ids."""
+        evicted = [self.entries.popitem(last=False)[0] for _ in range(len(self.entries) - max_entries)]
+        if evicted:
+            self._matrix = None
+        return evicted
+
+    def _rebuild(self) -> None:
+        self._ids = list(self.entries)
+        rows = list(self.entries.values())
+        self._matrix = np.stack([r[1] for r in rows]) if rows else np.empty((0, 0), dtype=np.float32)
+        self._versions = np.array([r[0] for r in rows], dtype=object)
+        self._expires = np.array([r[3].timestamp() for r in rows])
+
+    def nearest(self, embedding: List[float], prompt_version: str, now: datetime) -> Tuple[float, Optional[str], List[str]]:
+        """Return (cosine distance, id) of the closest live entry for `prompt_version`, plus expired ids."""
+        if self._matrix is None:
+            self._rebuild()
+        if not self._ids:
+            return math.inf, None, []
+        expired_mask = self._expires <= now.timestamp()
+        expired = [self._ids[i] for i in np.flatnonzero(expired_mask)]
+        scores = self._matrix @ _normalize(embedding)
+        scores[expired_mask | (self._versions != prompt_version)] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return math.inf, None, expired
+        return 1.0 - float(scores[best]), self._ids[best], expired
+
+
+# Loaded lazily from the DB on first use
+_semantic_index: Optional[SemanticIndex] = None
+
+
+def _normalize(vec: List[float]) -> np.ndarray:
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
+
+
+async def _load_semantic_index() -> SemanticIndex:
+    global _semantic_index
+    if _semantic_index is None:
+        async with SessionLocal() as db:
+            rows = (
+                await db.scalars(
+                    select(SemanticCache)
+                    .where(SemanticCache.created_at > datetime.now(timezone.utc) - SEMANTIC_CACHE_TTL)
+                    .order_by(SemanticCache.created_at.desc())
+                    .limit(SEMANTIC_CACHE_MAX_ENTRIES)
+                )
+            ).all()
+        index = SemanticIndex()
+        for r in reversed(rows):
+            # SQLite hands back naive UTC timestamps
+            created_at = r.created_at.replace(tzinfo=r.created_at.tzinfo or timezone.utc)
+            index.add(r.id, r.prompt_version, r.embedding, r.workflow_json, created_at + SEMANTIC_CACHE_TTL)
+        _semantic_index = index
+        logging.info(f"Semantic cache index loaded with {len(index)} entries.")
+    return _semantic_index
+
+
+async def _delete_semantic_entries(ids: List[str]) -> None:
+    try:
+        async with SessionLocal() as db:
+            await db.execute(delete(SemanticCache).where(SemanticCache.id.in_(ids)))
+            await db.commit()
+    except Exception as e:
+        logging.warning(f"Semantic cache eviction failed: {e}")
+
+
+async def find_similar_workflow(embedding: List[float], prompt_version: str) -> Optional[Dict[str, Any]]:
+    """Return the nearest live cached workflow within SEMANTIC_CACHE_MAX_DISTANCE, or None."""
+    try:
+        index = await _load_semantic_index()
+        best_distance, best_id, expired = index.nearest(embedding, prompt_version, datetime.now(timezone.utc))
+        if expired:
+            index.remove(expired)
+            logging.info(f"Semantic cache expired {len(expired)} entries.")
+            await _delete_semantic_entries(expired)
+    except Exception as e:
+        logging.warning(f"Semantic cache lookup failed: {e}")
+        return None
+
+    if best_id is None or best_distance >= SEMANTIC_CACHE_MAX_DISTANCE:
+        logging.info(f"Semantic cache miss (nearest distance={best_distance:.4f}, threshold={SEMANTIC_CACHE_MAX_DISTANCE})")
+        return None
+
+    workflow_json = index.entries[best_id][2]
+    # Revalidate on recall, as the exact-match DB tier does; a bad entry is evicted instead of served
+    try:
+        N8nWorkflowSchema.model_validate(workflow_json)
+    except ValidationError as e:
+        logging.warning(f"Evicting invalid semantic cache entry {best_id}: {e}")
+        index.remove([best_id])
+        await _delete_semantic_entries([best_id])
+        return None
+    logging.info(f"Semantic cache hit (distance={best_distance:.4f} < {SEMANTIC_CACHE_MAX_DISTANCE})")
+    index.touch(best_id)
+    return workflow_json
+
+
+async def store_semantic_workflow(
+    prompt: str, embedding: List[float], prompt_version: str, workflow_json: Dict[str, Any]
+) -> None:
+    """Persist a prompt embedding with its validated workflow, evicting least recently hit entries past the cap."""
+    try:
+        index = await _load_semantic_index()
+        entry = SemanticCache(
+            prompt=prompt,
+            prompt_version=prompt_version,
+            embedding=embedding,
+            workflow_json=workflow_json,
+        )
+        async with SessionLocal() as db:
+            db.add(entry)
+            await db.commit()
+        index.add(entry.id, prompt_version, embedding, workflow_json, datetime.now(timezone.utc) + SEMANTIC_CACHE_TTL)
+        evicted = index.evict_overflow(SEMANTIC_CACHE_MAX_ENTRIES)
+        if evicted:
+            await _delete_semantic_entries(evicted)
+    except Exception as e:
+        logging.warning(f"Semantic cache write failed: {e}")
@@ -0,0 +1,109 @@
+import orjson
+from typing import Any, List, Optional
+
+# ====================================================
+# Incremental JSON Scanner for Streamed Completions
+# ====================================================
+class IncrementalJsonParser:
+    """Scan a streamed JSON object once, emitting elements of one top-level array as they close.
+
+    Each character is visited exactly once across all `feed()` calls (brace/bracket depth,
+    in-string and escape state are carried between deltas). Deltas are kept as a list and joined
+    only when `buffer` is read, and an element's text is collected only while it is open, so the
+    cost is O(total length). `snapshot()` gives a best-effort view of the partial document.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self.array_complete = False
+        self._chunks: List[str] = []
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._last_key: Optional[str] = None
+        self._in_array = False
+        # Text of the depth-1 string and the array element still open at the end of the last delta
+        self._key_parts: Optional[List[str]] = None
+        self._item_parts: Optional[List[str]] = None
+        # Open containers' closing characters, and the last cut point that falls between whole
+        # values: after a top-level member, after a tracked array element, or just inside that array
+        self._closers: List[str] = []
+        self._safe_pos = 0
+        self._safe_closers = ""
+
+    @property
+    def buffer(self) -> str:
+        """All text fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, delta: str) -> List[Any]:
+        """Consume the next chunk and return any array elements completed by it."""
+        self._chunks.append(delta)
+        completed: List[Any] = []
+        # Where the open key / element starts within this delta (0 if carried over, -1 if none)
+        key_from = 0 if self._key_parts is not None else -1
+        item_from = 0 if self._item_parts is not None else -1
+        for i, ch in enumerate(delta):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if key_from >= 0:
+                        # At depth 1 the string right before '[' is always the member key
+                        self._last_key = orjson.loads("".join(self._key_parts or ()) + delta[key_from : i + 1])
+                        self._key_parts, key_from = None, -1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key_parts, key_from = [], i
+            elif ch in "{[":
+                if self._in_array and self._depth == 2:
+                    self._item_parts, item_from = [], i
+                self._depth += 1
+                self._closers.append("}" if ch == "{" else "]")
+                if ch == "[" and self._depth == 2 and self._last_key == self.array_key:
+                    self._in_array = True
+                    self._mark_safe(i)
+            elif ch in "}]":
+                self._depth -= 1
+                self._closers.pop()
+                if self._in_array and self._depth == 2 and item_from >= 0:
+                    completed.append(orjson.loads("".join(self._item_parts or ()) + delta[item_from : i + 1]))
+                    self._item_parts, item_from = None, -1
+                    self._mark_safe(i)
+                elif self._depth <= 1:
+                    if self._in_array:
+                        self._in_array = False
+                        self.array_complete = True
+                    self._mark_safe(i)
+        if key_from >= 0:
+            self._key_parts.append(delta[key_from:])
+        if item_from >= 0:
+            self._item_parts.append(delta[item_from:])
+        self._length += len(delta)
+        return completed
+
+    def _mark_safe(self, i: int) -> None:
+        self._safe_pos, self._safe_closers = self._length + i + 1, "".join(reversed(self._closers))
+
+    def snapshot(self) -> Optional[Any]:
+        """Best-effort parse of the document so far, cut after the last whole value.
+
+        Cut points are the end of a top-level member's object/array value, the end of a tracked
+        array element, and the opening of that array. Still-open containers are closed there, so a
+        half-written element (even one with completed nested values) is dropped, not guessed at.
+        """
+        if self._safe_pos == 0:
+            return None
+        try:
+            return orjson.loads(self.buffer[: self._safe_pos] + self._safe_closers)
+        except orjson.JSONDecodeError:
+            return None
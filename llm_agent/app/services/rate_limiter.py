@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import time
+
+# ====================================================
+# Token-Bucket Throttler (RPM + TPM)
+# ====================================================
+class RateLimiter:
+    """Token-bucket throttler for OpenAI request-per-minute and token-per-minute limits.
+
+    Both buckets refill continuously; callers wait until a request slot and enough
+    token capacity are available, mirroring the OpenAI cookbook's parallel processor.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.max_requests = float(requests_per_minute)
+        self.max_tokens = float(tokens_per_minute)
+        self.available_requests = self.max_requests
+        self.available_tokens = self.max_tokens
+        self.last_update = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.available_requests = min(
+            self.max_requests, self.available_requests + self.max_requests * elapsed / 60.0
+        )
+        self.available_tokens = min(self.max_tokens, self.available_tokens + self.max_tokens * elapsed / 60.0)
+        self.last_update = now
+
+    async def acquire(self, tokens: int) -> None:
+        """Block until one request and `tokens` tokens of capacity can be consumed."""
+        # Never ask for more than a full bucket, or the request could wait forever
+        tokens = min(float(tokens), self.max_tokens)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                wait = max(
+                    (1 - self.available_requests) * 60.0 / self.max_requests,
+                    (tokens - self.available_tokens) * 60.0 / self.max_tokens,
+                )
+                logging.info(f"Rate limit reached, throttling for {wait:.2f}s")
+                await asyncio.sleep(wait)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+# ai_service builds its AsyncOpenAI client at import time; tests never reach the network
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services import ai_service  # noqa: E402
+
+
+def wire_node(name, node_type="n8n-nodes-base.set", parameters=None):
+    """A node in the strict structured-output shape (parameters as a JSON string)."""
+    return {
+        "name": name,
+        "type": node_type,
+        "typeVersion": 1,
+        "position": [0, 0],
+        "parameters": orjson.dumps(parameters or {}).decode(),
+    }
+
+
+@pytest.fixture
+def stream_workflow(monkeypatch):
+    """Make the primary generation stream `workflow` back in small chunks."""
+
+    def install(workflow, chunk_size=7):
+        raw = orjson.dumps(workflow).decode()
+
+        async def chat_completion(**kwargs):
+            async def chunks():
+                for i in range(0, len(raw), chunk_size):
+                    delta = SimpleNamespace(content=raw[i : i + chunk_size])
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+            return chunks()
+
+        monkeypatch.setattr(ai_service, "chat_completion", chat_completion)
+
+    return install
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Record cache writes instead of touching the database."""
+    calls = []
+
+    async def store(prompt, embedding, workflow_json):
+        calls.append(workflow_json)
+
+    monkeypatch.setattr(ai_service, "_store_workflow", store)
+    return calls
+
+
+def run_pipeline(prompt):
+    """Run the generation pipeline and let its background cache writes finish."""
+
+    async def run():
+        result = await ai_service._run_generation_pipeline(prompt)
+        await asyncio.gather(*ai_service._background_writes)
+        return result
+
+    return asyncio.run(run())
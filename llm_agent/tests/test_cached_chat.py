@@ -0,0 +1,78 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from app.services import ai_service
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """In-memory sub-call cache plus a fake chat completion that counts calls."""
+    state = SimpleNamespace(cache={}, calls=[], content="answer", function_call=None)
+
+    async def get_cached(key):
+        return state.cache.get(key)
+
+    async def store_cached(key, model, content):
+        state.cache[key] = content
+
+    async def chat_completion(**kwargs):
+        state.calls.append(kwargs)
+        message = SimpleNamespace(content=state.content, function_call=state.function_call)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(ai_service, "get_cached_completion", get_cached)
+    monkeypatch.setattr(ai_service, "store_cached_completion", store_cached)
+    monkeypatch.setattr(ai_service, "chat_completion", chat_completion)
+    return state
+
+
+def test_identical_requests_are_served_from_the_cache(llm):
+    async def run():
+        first = await ai_service.cached_chat(MESSAGES, "m")
+        llm.content = "changed"
+        return first, await ai_service.cached_chat(MESSAGES, "m")
+
+    assert asyncio.run(run()) == ("answer", "answer")
+    assert len(llm.calls) == 1
+
+
+def test_model_messages_and_parameters_are_part_of_the_key(llm):
+    async def run():
+        await ai_service.cached_chat(MESSAGES, "m")
+        await ai_service.cached_chat(MESSAGES, "other-model")
+        await ai_service.cached_chat([{"role": "user", "content": "bye"}], "m")
+        await ai_service.cached_chat(MESSAGES, "m", temperature=0)
+
+    asyncio.run(run())
+    assert len(llm.calls) == 4
+    assert len(llm.cache) == 4
+
+
+def test_function_call_arguments_replace_content(llm):
+    llm.content, llm.function_call = None, SimpleNamespace(arguments='{"scripts": []}')
+    assert asyncio.run(ai_service.cached_chat(MESSAGES, "m", functions=[])) == '{"scripts": []}'
+
+
+def test_empty_responses_are_not_cached(llm):
+    llm.content = "  "
+    assert asyncio.run(ai_service.cached_chat(MESSAGES, "m")) == "  "
+    assert llm.cache == {}
+
+
+def test_registered_schemas_are_keyed_by_their_import_time_digest(llm):
+    schema = ai_service.n8n_workflow_response_format
+    digest = hashlib.sha256(orjson.dumps(schema)).hexdigest()
+    assert ai_service._SCHEMA_DIGESTS[id(schema)] == digest
+
+    asyncio.run(ai_service.cached_chat(MESSAGES, "m", response_format=schema))
+    payload = {"model": "m", "messages": MESSAGES, "response_format": digest}
+    expected_key = hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    assert list(llm.cache) == [expected_key]
+    # The full schema still goes to the API; only the cache key uses the digest
+    assert llm.calls[0]["response_format"] is schema
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.services import ai_service
+from tests.conftest import wire_node
+
+GOOD_JS = "const items = $input.all();\nreturn items;"
+LEGACY_JS = "return $item(0);"
+CODE = "n8n-nodes-base.code"
+
+
+@pytest.fixture
+def batched(monkeypatch):
+    """Record which Code nodes are sent for regeneration and answer with GOOD_JS."""
+    requested = []
+
+    async def generate(prompt, specs):
+        requested.extend(spec["name"] for spec in specs)
+        return {spec["name"]: GOOD_JS for spec in specs}
+
+    monkeypatch.setattr(ai_service, "generate_code_nodes_js_batched", generate)
+    return requested
+
+
+def test_lint_streamed_node_verdicts():
+    assert ai_service.lint_streamed_node(wire_node("Set")) is None
+    assert ai_service.lint_streamed_node(wire_node("C", CODE, {"jsCode": GOOD_JS})) is False
+    assert ai_service.lint_streamed_node(wire_node("C", CODE, {"jsCode": LEGACY_JS})) is True
+    assert ai_service.lint_streamed_node(wire_node("C", CODE, {"jsCode": '{"a": 1}'})) is True
+    assert ai_service.lint_streamed_node({**wire_node("C", CODE), "parameters": "{broken"}) is True
+
+
+def test_stream_collects_code_node_verdicts(stream_workflow):
+    stream_workflow(
+        {
+            "name": "W",
+            "nodes": [
+                wire_node("Set"),
+                wire_node("Good", CODE, {"jsCode": GOOD_JS}),
+                wire_node("Dup", CODE, {"jsCode": LEGACY_JS}),
+                wire_node("Dup", CODE, {"jsCode": GOOD_JS}),
+            ],
+            "connections": [],
+        },
+        chunk_size=3,
+    )
+    raw, stale_scripts = asyncio.run(ai_service.stream_structured_workflow([]))
+    assert raw.startswith('{"name":"W"')
+    assert stale_scripts == {"Good": False, "Dup": True}
+
+
+def test_streamed_verdicts_replace_the_local_scan(batched):
+    workflow = {
+        "nodes": [
+            {"name": "Trusted", "type": CODE, "parameters": {"jsCode": LEGACY_JS}},
+            {"name": "Flagged", "type": CODE, "parameters": {"jsCode": GOOD_JS}},
+            {"name": "Unseen", "type": CODE, "parameters": {"functionCode": LEGACY_JS}},
+        ]
+    }
+    stale_scripts = {"Trusted": False, "Flagged": True}
+    out = asyncio.run(ai_service.lint_and_modernize_code_nodes(workflow, "p", stale_scripts))
+    assert batched == ["Flagged", "Unseen"]
+    assert [n["parameters"]["jsCode"] for n in out["nodes"]] == [LEGACY_JS, GOOD_JS, GOOD_JS]
+
+
+def test_without_verdicts_every_code_node_is_scanned(batched):
+    workflow = {
+        "nodes": [
+            {"name": "Legacy", "type": "n8n-nodes-base.function", "parameters": {"functionCode": LEGACY_JS}},
+            {"name": "Good", "type": CODE, "parameters": {"jsCode": GOOD_JS}},
+            {"name": "Empty", "type": CODE, "parameters": {}},
+        ]
+    }
+    out = asyncio.run(ai_service.lint_and_modernize_code_nodes(workflow, "p"))
+    assert batched == ["Legacy", "Empty"]
+    assert all(n["type"] == CODE and n["parameters"]["language"] == "JavaScript" for n in out["nodes"])
+    assert "functionCode" not in out["nodes"][0]["parameters"]
@@ -0,0 +1,73 @@
+from app.services.ai_service import sanitize_connections
+
+
+def _nodes(*names):
+    return [{"name": n, "type": "n8n-nodes-base.set"} for n in names]
+
+
+def _link(target):
+    return {"node": target, "type": "main", "index": 0}
+
+
+def _targets(connections):
+    return {
+        (src, link["node"]) for src, edges in connections.items() for branch in edges["main"] for link in branch
+    }
+
+
+def test_two_node_cycle_is_broken():
+    connections = {"A": {"main": [[_link("B")]]}, "B": {"main": [[_link("A")]]}}
+    assert sanitize_connections(connections, _nodes("A", "B")) == {"A": {"main": [[_link("B")]]}}
+
+
+def test_three_node_cycle_drops_only_the_back_edge():
+    connections = {
+        "A": {"main": [[_link("B")]]},
+        "B": {"main": [[_link("C")]]},
+        "C": {"main": [[_link("A")]]},
+    }
+    out = sanitize_connections(connections, _nodes("A", "B", "C"))
+    assert _targets(out) == {("A", "B"), ("B", "C")}
+
+
+def test_back_edges_point_toward_the_first_node():
+    # Trigger-first node order decides which edge of the cycle is the back-edge
+    connections = {"A": {"main": [[_link("B")]]}, "B": {"main": [[_link("A")]]}}
+    assert _targets(sanitize_connections(connections, _nodes("B", "A"))) == {("B", "A")}
+
+
+def test_diamond_is_not_a_cycle():
+    connections = {
+        "A": {"main": [[_link("B"), _link("C")]]},
+        "B": {"main": [[_link("D")]]},
+        "C": {"main": [[_link("D")]]},
+    }
+    assert sanitize_connections(connections, _nodes("A", "B", "C", "D")) == connections
+
+
+def test_unknown_nodes_and_self_loops_are_removed():
+    connections = {
+        "A": {"main": [[_link("A"), _link("Ghost"), _link("B")]]},
+        "Ghost": {"main": [[_link("A")]]},
+        "B": {"main": [[_link("B")]]},
+    }
+    assert sanitize_connections(connections, _nodes("A", "B")) == {"A": {"main": [[_link("B")]]}}
+
+
+def test_if_node_keeps_empty_true_branch_to_preserve_indices():
+    connections = {"If": {"main": [[], [_link("False")]]}}
+    nodes = [{"name": "If", "type": "n8n-nodes-base.if"}, *_nodes("False")]
+    assert sanitize_connections(connections, nodes) == connections
+
+
+def test_if_node_trailing_empty_branches_are_trimmed():
+    connections = {"If": {"main": [[_link("True")], [], []]}}
+    nodes = [{"name": "If", "type": "n8n-nodes-base.if"}, *_nodes("True")]
+    assert sanitize_connections(connections, nodes) == {"If": {"main": [[_link("True")]]}}
+
+
+def test_if_node_with_only_empty_branches_is_dropped():
+    connections = {"If": {"main": [[], [_link("Ghost")]]}}
+    nodes = [{"name": "If", "type": "n8n-nodes-base.if"}]
+    assert sanitize_connections(connections, nodes) == {}
+
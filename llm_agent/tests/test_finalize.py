@@ -0,0 +1,53 @@
+import asyncio
+
+from app.services import ai_service
+
+GOOD_JS = "const items = $input.all();\nreturn items;"
+LEGACY_JS = "return $item(0);"
+CODE = "n8n-nodes-base.code"
+
+
+def test_ai_correction_gets_the_concurrently_modernized_scripts(monkeypatch):
+    batches = []
+    seen_by_validation = []
+
+    async def generate(prompt, specs):
+        batches.append([spec["name"] for spec in specs])
+        return {spec["name"]: GOOD_JS for spec in specs}
+
+    async def validate(prompt, workflow_json):
+        seen_by_validation.append(workflow_json["nodes"][0]["parameters"]["jsCode"])
+        return {
+            "name": "Corrected",
+            "nodes": [
+                {"name": "C", "type": CODE, "parameters": {"jsCode": LEGACY_JS}},
+                {"name": "New", "type": CODE, "parameters": {}},
+            ],
+            "connections": {"C": {"main": [[{"node": "New", "type": "main", "index": 0}]]}},
+        }
+
+    monkeypatch.setattr(ai_service, "generate_code_nodes_js_batched", generate)
+    monkeypatch.setattr(ai_service, "validate_with_ai", validate)
+    workflow = {
+        "name": "W",
+        "nodes": [{"name": "C", "type": CODE, "parameters": {"jsCode": LEGACY_JS}}],
+        "connections": {"C": {"main": [[{"node": "Ghost", "type": "main", "index": 0}]]}},
+    }
+
+    out = asyncio.run(ai_service.finalize_workflow(workflow, "p"))
+
+    # Validation works on its own copy; modernization regenerates the original script in parallel
+    assert seen_by_validation == [LEGACY_JS]
+    # The corrected "C" takes the fresh script; only the node the correction added is generated again
+    assert batches == [["C"], ["New"]]
+    assert out["name"] == "Corrected"
+    assert [n["parameters"]["jsCode"] for n in out["nodes"]] == [GOOD_JS, GOOD_JS]
+
+
+def test_locally_valid_workflow_skips_ai_correction(monkeypatch):
+    async def validate(prompt, workflow_json):
+        raise AssertionError("validate_with_ai should not run")
+
+    monkeypatch.setattr(ai_service, "validate_with_ai", validate)
+    workflow = {"name": "W", "nodes": [{"name": "A", "type": "n8n-nodes-base.set"}], "connections": {}}
+    assert asyncio.run(ai_service.finalize_workflow(workflow, "p")) == workflow
@@ -0,0 +1,61 @@
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from app.services.ai_service import parse_structured_workflow, repair_json_locally
+
+WORKFLOW = {
+    "name": "W",
+    "nodes": [
+        {"name": "A", "type": "n8n-nodes-base.code", "typeVersion": 1, "position": [0, 0], "parameters": "{}"},
+    ],
+    "connections": [],
+}
+
+
+def test_valid_json_is_returned_unchanged():
+    assert repair_json_locally(orjson.dumps(WORKFLOW).decode()) == WORKFLOW
+
+
+def test_code_fences_are_stripped():
+    assert repair_json_locally("```json\n" + orjson.dumps(WORKFLOW).decode() + "\n```") == WORKFLOW
+
+
+def test_trailing_commas_are_dropped():
+    assert repair_json_locally('{"a": [1, 2, ], "b": {"c": 1 ,},}') == {"a": [1, 2], "b": {"c": 1}}
+
+
+def test_commas_inside_strings_are_kept():
+    broken = r'{"jsCode": "const a = [1, ]; const b = {x: 1, }; const s = \"q, ]\";", "n": [1,],}'
+    assert repair_json_locally(broken) == {
+        "jsCode": 'const a = [1, ]; const b = {x: 1, }; const s = "q, ]";',
+        "n": [1],
+    }
+
+
+def test_truncated_after_nodes_recovers_complete_nodes():
+    raw = orjson.dumps(WORKFLOW).decode()
+    truncated = raw[: raw.index('"connections"') + len('"connections":[')]
+    assert repair_json_locally(truncated) == {"name": "W", "nodes": WORKFLOW["nodes"]}
+
+
+def test_truncated_inside_nodes_is_not_recovered():
+    raw = orjson.dumps(WORKFLOW).decode()
+    assert repair_json_locally(raw[: raw.index('"position"')]) is None
+
+
+def test_unrepairable_input_returns_none():
+    assert repair_json_locally("not json at all") is None
+
+
+def test_parse_structured_workflow_repairs_a_truncated_edge_list():
+    raw = orjson.dumps(WORKFLOW).decode()
+    truncated = raw[: raw.index('"connections"') + len('"connections":[')]
+    workflow = parse_structured_workflow(truncated)
+    assert [n.name for n in workflow.nodes] == ["A"]
+    assert workflow.connections == []
+
+
+def test_parse_structured_workflow_raises_when_repair_fails():
+    with pytest.raises(ValidationError):
+        parse_structured_workflow('{"name": "W", "nodes": [{"name": "A"')
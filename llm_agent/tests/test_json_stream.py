@@ -0,0 +1,66 @@
+import orjson
+
+from app.services.json_stream import IncrementalJsonParser
+
+DOCUMENT = orjson.dumps(
+    {
+        "name": "W",
+        "nodes": [
+            {"name": "A", "position": [0, 0], "parameters": '{"jsCode": "if (x) { return [1]; }"}'},
+            {"name": "B \"quoted\" ]}", "position": [220, 0], "parameters": "{}"},
+        ],
+        "connections": [{"source": "A", "target": "B", "output": 0}],
+    }
+).decode()
+
+
+def test_emits_each_element_as_it_closes():
+    parser = IncrementalJsonParser("nodes")
+    first_close = DOCUMENT.index("},{") + 1
+    assert [n["name"] for n in parser.feed(DOCUMENT[:first_close])] == ["A"]
+    assert not parser.array_complete
+    assert [n["name"] for n in parser.feed(DOCUMENT[first_close:])] == ['B "quoted" ]}']
+    assert parser.array_complete
+
+
+def test_chunk_boundaries_do_not_matter():
+    for size in (1, 2, 3, 7, 64):
+        parser = IncrementalJsonParser("nodes")
+        emitted = []
+        for i in range(0, len(DOCUMENT), size):
+            emitted.extend(parser.feed(DOCUMENT[i : i + size]))
+        assert emitted == orjson.loads(DOCUMENT)["nodes"]
+        assert parser.buffer == DOCUMENT
+
+
+def test_only_the_tracked_array_is_emitted():
+    parser = IncrementalJsonParser("connections")
+    assert parser.feed(DOCUMENT) == [{"source": "A", "target": "B", "output": 0}]
+
+
+
+def test_snapshot_before_any_cut_point_is_none():
+    parser = IncrementalJsonParser("nodes")
+    parser.feed('{"name": "W", "no')
+    assert parser.snapshot() is None
+
+
+def test_snapshot_drops_half_written_element():
+    parser = IncrementalJsonParser("nodes")
+    parser.feed('{"name":"x","nodes":[{"name":"A","position":[1,2],"type":"x')
+    assert parser.snapshot() == {"name": "x", "nodes": []}
+
+
+def test_snapshot_keeps_completed_elements_of_a_truncated_array():
+    parser = IncrementalJsonParser("nodes")
+    parser.feed('{"name":"x","nodes":[{"name":"A"},{"name":"B","position":[1')
+    assert parser.snapshot() == {"name": "x", "nodes": [{"name": "A"}]}
+    assert not parser.array_complete
+
+
+def test_snapshot_drops_a_truncated_later_member():
+    truncated = DOCUMENT[: DOCUMENT.index('"target"')]
+    parser = IncrementalJsonParser("nodes")
+    parser.feed(truncated)
+    assert parser.array_complete
+    assert parser.snapshot() == {"name": "W", "nodes": orjson.loads(DOCUMENT)["nodes"]}
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+
+WORKFLOW = {"name": "W", "nodes": [{"name": "A", "type": "n8n-nodes-base.set"}], "connections": {}}
+
+
+class FakeSession:
+    def __init__(self, fail=False):
+        self.added = []
+        self.committed = False
+        self.fail = fail
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    async def commit(self):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.committed = True
+
+
+@pytest.fixture
+def session(monkeypatch):
+    sessions = []
+
+    def factory(fail=False):
+        def session_local():
+            sessions.append(FakeSession(fail))
+            return sessions[-1]
+
+        monkeypatch.setattr(main, "SessionLocal", session_local)
+        return sessions
+
+    return factory
+
+
+def test_generate_responds_then_persists_in_the_background(monkeypatch, session):
+    sessions = session()
+
+    async def generate_workflow(prompt):
+        assert sessions == []  # no DB session is opened before the response
+        return WORKFLOW
+
+    monkeypatch.setattr(main, "generate_workflow", generate_workflow)
+    response = TestClient(main.app).post("/generate", json={"prompt": "p"})
+    assert response.status_code == 200 and response.json() == WORKFLOW
+    [saved] = sessions[0].added
+    assert (saved.name, saved.prompt, saved.workflow_json) == ("W", "p", WORKFLOW)
+    assert sessions[0].committed
+
+
+def test_generation_errors_become_500(monkeypatch, session):
+    sessions = session()
+
+    async def generate_workflow(prompt):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(main, "generate_workflow", generate_workflow)
+    response = TestClient(main.app).post("/generate", json={"prompt": "p"})
+    assert response.status_code == 500 and response.json() == {"detail": "boom"}
+    assert sessions == []
+
+
+def test_persist_failures_are_logged_not_raised(session, caplog):
+    session(fail=True)
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(main._persist(WORKFLOW, "p"))
+    assert "Failed to persist workflow 'W'" in caplog.text
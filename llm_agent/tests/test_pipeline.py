@@ -0,0 +1,56 @@
+import asyncio
+
+import orjson
+
+from app.services import ai_service
+from tests.conftest import run_pipeline, wire_node
+
+WORKFLOW = {
+    "name": "W",
+    "nodes": [wire_node("Start", "n8n-nodes-base.manualTrigger"), wire_node("Set")],
+    "connections": [{"source": "Start", "target": "Set", "output": 0, "input": 0}],
+}
+
+
+def test_valid_workflow_is_cached(stream_workflow, stored):
+    stream_workflow(WORKFLOW)
+    result = run_pipeline("p")
+    assert [n["name"] for n in result["nodes"]] == ["Start", "Set"]
+    assert stored == [result]
+
+
+def test_workflow_failing_final_validation_is_not_cached(monkeypatch, stream_workflow, stored):
+    stream_workflow(WORKFLOW)
+
+    async def finalize(workflow_json, prompt, stale_scripts=None):
+        return {"name": "AI Generated Workflow", "nodes": [], "connections": {}}
+
+    monkeypatch.setattr(ai_service, "finalize_workflow", finalize)
+    assert run_pipeline("p")["nodes"] == []
+    assert stored == []
+
+
+def test_empty_name_is_filled_before_the_single_validation_pass(stream_workflow, stored):
+    stream_workflow({**WORKFLOW, "name": ""})
+    assert run_pipeline("p")["name"] == "AI Generated Workflow"
+
+
+def test_unfixable_output_is_retried_with_feedback(monkeypatch, stored):
+    outputs = [{**WORKFLOW, "nodes": []}, WORKFLOW]
+    sent = []
+
+    async def stream(messages):
+        sent.append(list(messages))
+        return orjson.dumps(outputs[len(sent) - 1]).decode(), {}
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(ai_service, "stream_structured_workflow", stream)
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+
+    result = run_pipeline("p")
+    assert [n["name"] for n in result["nodes"]] == ["Start", "Set"]
+    assert len(sent) == 2
+    assert sent[1][-2]["role"] == "assistant"
+    assert "nodes" in sent[1][-1]["content"]
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ai_service
+from app.services import rate_limiter as rate_limiter_module
+from app.services.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; the limiter's sleeps advance it instead of blocking."""
+    state = SimpleNamespace(now=0.0, sleeps=[])
+
+    async def sleep(seconds):
+        state.sleeps.append(seconds)
+        state.now += seconds
+
+    monkeypatch.setattr(rate_limiter_module, "time", SimpleNamespace(monotonic=lambda: state.now))
+    monkeypatch.setattr(rate_limiter_module, "asyncio", SimpleNamespace(Lock=asyncio.Lock, sleep=sleep))
+    return state
+
+
+def test_acquire_within_budget_does_not_wait(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire(100)
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+    assert limiter.available_requests == 57
+    assert limiter.available_tokens == 700
+
+
+def test_token_budget_throttles_until_refilled(clock):
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600)
+
+    async def run():
+        await limiter.acquire(600)
+        await limiter.acquire(300)
+
+    asyncio.run(run())
+    # 300 tokens at 10 tokens/s
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_request_budget_throttles_until_refilled(clock):
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=10_000)
+
+    async def run():
+        for _ in range(3):
+            await limiter.acquire(1)
+
+    asyncio.run(run())
+    assert clock.sleeps == [pytest.approx(30.0)]
+
+
+def test_oversized_request_is_capped_at_a_full_bucket(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100)
+
+    asyncio.run(limiter.acquire(10_000))
+    assert clock.sleeps == []
+    assert limiter.available_tokens == 0
+
+
+@pytest.fixture
+def acquired(monkeypatch):
+    """Replace each model's bucket with a recorder and stub out the OpenAI client."""
+    calls = []
+
+    class Recorder:
+        def __init__(self, model):
+            self.model = model
+
+        async def acquire(self, tokens):
+            calls.append((self.model, tokens))
+
+    async def create(**kwargs):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+
+    monkeypatch.setattr(ai_service, "rate_limiters", {m: Recorder(m) for m in ai_service.MODEL_RATE_LIMITS})
+    monkeypatch.setattr(
+        ai_service,
+        "client",
+        SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=create)),
+            embeddings=SimpleNamespace(create=create),
+        ),
+    )
+    return calls
+
+
+def test_chat_completions_draw_from_their_own_models_bucket(acquired):
+    async def run():
+        await ai_service.chat_completion(model=ai_service.AUX_MODEL, messages=[{"role": "user", "content": "x" * 40}])
+        await ai_service.chat_completion(model=ai_service.GENERATION_MODEL, messages=[], max_tokens=50)
+
+    asyncio.run(run())
+    assert acquired == [(ai_service.AUX_MODEL, 10 + 1000), (ai_service.GENERATION_MODEL, 50)]
+
+
+def test_embeddings_are_throttled(acquired):
+    assert asyncio.run(ai_service.embed_prompt("x" * 40)) == [0.1, 0.2]
+    assert acquired == [(ai_service.EMBEDDING_MODEL, 11)]
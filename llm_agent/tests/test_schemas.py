@@ -0,0 +1,64 @@
+import pytest
+from pydantic import ValidationError
+
+from app.schemas.workflow import StructuredConnections, StructuredWorkflow
+
+
+def _edge(source, target, output=0, input=0):
+    return {"source": source, "target": target, "output": output, "input": input}
+
+
+def _link(target, index=0):
+    return {"node": target, "type": "main", "index": index}
+
+
+def test_edges_become_n8n_connections_with_output_and_input_indices():
+    connections = StructuredConnections.model_validate(
+        {
+            "connections": [
+                _edge("If", "True"),
+                _edge("If", "False", output=1),
+                _edge("True", "Merge"),
+                _edge("False", "Merge", input=1),
+            ]
+        }
+    ).to_n8n()
+    assert connections == {
+        "If": {"main": [[_link("True")], [_link("False")]]},
+        "True": {"main": [[_link("Merge")]]},
+        "False": {"main": [[_link("Merge", 1)]]},
+    }
+
+
+def test_a_skipped_output_leaves_an_empty_branch():
+    connections = StructuredConnections.model_validate({"connections": [_edge("If", "False", output=1)]}).to_n8n()
+    assert connections == {"If": {"main": [[], [_link("False")]]}}
+
+
+def test_edge_input_is_required():
+    with pytest.raises(ValidationError):
+        StructuredConnections.model_validate({"connections": [{"source": "A", "target": "B", "output": 0}]})
+
+
+def test_nodes_decode_parameters_and_normalize_type_version():
+    workflow = StructuredWorkflow.model_validate(
+        {
+            "name": "W",
+            "nodes": [
+                {"name": "A", "type": "t", "typeVersion": 2.0, "position": [0, 0], "parameters": '{"url": "x"}'},
+                {"name": "B", "type": "t", "typeVersion": 4.2, "position": [1, 0], "parameters": "  "},
+                {"name": "C", "type": "t", "typeVersion": 1, "position": [2, 0], "parameters": "{broken"},
+                {"name": "D", "type": "t", "typeVersion": 1, "position": [3, 0], "parameters": "[1, 2]"},
+            ],
+            "connections": [_edge("A", "B")],
+        }
+    ).to_n8n()
+    assert workflow["name"] == "W"
+    assert [(n["typeVersion"], n["parameters"]) for n in workflow["nodes"]] == [
+        (2, {"url": "x"}),
+        (4.2, {}),
+        (1, {}),
+        (1, {}),
+    ]
+    assert isinstance(workflow["nodes"][0]["typeVersion"], int)
+    assert workflow["connections"] == {"A": {"main": [[_link("B")]]}}
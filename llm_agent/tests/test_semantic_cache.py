@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import cache_service
+from app.services.cache_service import SemanticIndex, find_similar_workflow
+
+VALID = {"name": "W", "nodes": [{"name": "A", "type": "n8n-nodes-base.set"}], "connections": {}}
+LATER = datetime.now(timezone.utc) + timedelta(days=1)
+
+
+def _index(*entries):
+    index = SemanticIndex()
+    for entry_id, version, embedding, expires_at in entries:
+        index.add(entry_id, version, embedding, {**VALID, "id": entry_id}, expires_at)
+    return index
+
+
+@pytest.fixture
+def deleted(monkeypatch):
+    ids = []
+
+    async def delete(entry_ids):
+        ids.extend(entry_ids)
+
+    monkeypatch.setattr(cache_service, "_delete_semantic_entries", delete)
+    return ids
+
+
+def _use_index(monkeypatch, index):
+    async def load():
+        return index
+
+    monkeypatch.setattr(cache_service, "_load_semantic_index", load)
+
+
+def test_nearest_entry_for_the_prompt_version_wins():
+    index = _index(
+        ("same", "v2", [1.0, 0.0], LATER),
+        ("close", "v2", [0.9, 0.1], LATER),
+        ("other-version", "v1", [1.0, 0.0], LATER),
+    )
+    distance, best_id, _ = index.nearest([2.0, 0.0], "v2", datetime.now(timezone.utc))
+    assert best_id == "same"
+    assert abs(distance) < 1e-6
+
+    index.remove(["same"])
+    distance, best_id, _ = index.nearest([1.0, 0.0], "v2", datetime.now(timezone.utc))
+    assert best_id == "close"
+    assert 0 < distance < 0.01
+
+
+def test_no_entry_for_the_prompt_version_misses():
+    now = datetime.now(timezone.utc)
+    assert _index(("a", "v1", [1.0, 0.0], LATER)).nearest([1.0, 0.0], "v2", now)[1] is None
+    assert SemanticIndex().nearest([1.0, 0.0], "v2", now)[1] is None
+
+
+def test_find_similar_workflow_applies_the_distance_threshold(monkeypatch, deleted):
+    _use_index(monkeypatch, _index(("a", "v2", [1.0, 0.0], LATER)))
+    assert asyncio.run(find_similar_workflow([1.0, 0.01], "v2"))["id"] == "a"
+    assert asyncio.run(find_similar_workflow([1.0, 1.0], "v2")) is None
+
+
+def test_find_similar_workflow_evicts_invalid_hits(monkeypatch, deleted):
+    index = SemanticIndex()
+    index.add("bad", "v2", [1.0, 0.0], {"name": "W", "nodes": []}, LATER)
+    _use_index(monkeypatch, index)
+    assert asyncio.run(find_similar_workflow([1.0, 0.0], "v2")) is None
+    assert deleted == ["bad"]
+    assert len(index) == 0
+
+
+def test_expired_entries_are_skipped_and_dropped(monkeypatch, deleted):
+    earlier = datetime.now(timezone.utc) - timedelta(seconds=1)
+    index = _index(("expired", "v2", [1.0, 0.0], earlier), ("live", "v2", [0.9, 0.1], LATER))
+    _use_index(monkeypatch, index)
+    assert asyncio.run(find_similar_workflow([1.0, 0.0], "v2"))["id"] == "live"
+    assert deleted == ["expired"]
+    assert list(index.entries) == ["live"]
+
+
+def test_overflow_evicts_the_least_recently_hit(monkeypatch, deleted):
+    index = _index(("a", "v2", [1.0, 0.0], LATER), ("b", "v2", [0.0, 1.0], LATER))
+    _use_index(monkeypatch, index)
+    asyncio.run(find_similar_workflow([1.0, 0.0], "v2"))  # a hit moves "a" to the back
+    index.add("c", "v2", [1.0, 1.0], VALID, LATER)
+    assert index.evict_overflow(2) == ["b"]
+    assert list(index.entries) == ["a", "c"]
@@ -0,0 +1,44 @@
+import asyncio
+
+from app.services import ai_service
+
+
+def test_singleflight_coalesces_identical_prompts(monkeypatch):
+    calls = []
+
+    async def pipeline(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return {"prompt": prompt}
+
+    monkeypatch.setattr(ai_service, "_run_generation_pipeline", pipeline)
+
+    async def run():
+        return await asyncio.gather(*(ai_service._generate_singleflight("p") for _ in range(3)))
+
+    assert asyncio.run(run()) == [{"prompt": "p"}] * 3
+    assert calls == ["p"]
+    assert ai_service._inflight == {}
+
+
+def test_singleflight_follower_takes_over_from_cancelled_leader(monkeypatch):
+    calls = []
+
+    async def pipeline(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return {"run": len(calls)}
+
+    monkeypatch.setattr(ai_service, "_run_generation_pipeline", pipeline)
+
+    async def run():
+        leader = asyncio.create_task(ai_service._generate_singleflight("p"))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(ai_service._generate_singleflight("p")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(run()) == [{"run": 2}, {"run": 2}]
+    assert len(calls) == 2
+    assert ai_service._inflight == {}
@@ -0,0 +1,19 @@
+from app.services.ai_service import _WORKFLOW_SKELETON, fill_workflow_skeleton
+
+
+def test_missing_and_empty_required_keys_are_filled():
+    filled = fill_workflow_skeleton({"name": "", "nodes": [{"name": "A"}], "id": "keep"})
+    assert filled == {"name": "AI Generated Workflow", "nodes": [{"name": "A"}], "connections": {}, "id": "keep"}
+
+
+def test_present_values_win_over_the_skeleton():
+    workflow = {"name": "W", "nodes": [{"name": "A"}], "connections": {"A": {"main": []}}}
+    assert fill_workflow_skeleton(workflow) == workflow
+
+
+def test_filled_containers_are_not_shared_with_the_skeleton():
+    filled = fill_workflow_skeleton({})
+    filled["nodes"].append({"name": "A"})
+    filled["connections"]["A"] = {}
+    assert _WORKFLOW_SKELETON == {"name": "AI Generated Workflow", "nodes": [], "connections": {}}
+    assert fill_workflow_skeleton({})["nodes"] == []
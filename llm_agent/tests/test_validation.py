@@ -0,0 +1,67 @@
+import asyncio
+
+import orjson
+import pytest
+
+from app.services import ai_service
+from tests.conftest import wire_node
+
+ORIGINAL = {
+    "name": "W",
+    "id": "AI-1234",
+    "active": False,
+    "tags": ["ai-generated"],
+    "settings": {"timezone": "UTC"},
+    "nodes": [{"name": "A", "type": "n8n-nodes-base.set"}],
+    "connections": {},
+}
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Answer validate_with_ai's and repair_json_with_ai's sub-calls in order."""
+    queue = []
+
+    async def cached_chat(messages, model, **kwargs):
+        return queue.pop(0)
+
+    monkeypatch.setattr(ai_service, "cached_chat", cached_chat)
+    return queue
+
+
+def test_correction_keeps_metadata_the_schema_does_not_carry(replies):
+    replies.append(orjson.dumps({"name": "Fixed", "nodes": [wire_node("B")], "connections": []}).decode())
+    out = asyncio.run(ai_service.validate_with_ai("p", ORIGINAL))
+    assert out["name"] == "Fixed" and [n["name"] for n in out["nodes"]] == ["B"]
+    assert {k: out[k] for k in ("id", "active", "tags", "settings")} == {
+        k: ORIGINAL[k] for k in ("id", "active", "tags", "settings")
+    }
+
+
+def test_repaired_correction_keeps_metadata(replies):
+    replies.extend(['{"off": "schema"}', orjson.dumps({"name": "Repaired", "nodes": [{"name": "B"}]}).decode()])
+    out = asyncio.run(ai_service.validate_with_ai("p", ORIGINAL))
+    assert out["name"] == "Repaired" and out["nodes"] == [{"name": "B"}]
+    assert out["id"] == "AI-1234" and out["settings"] == {"timezone": "UTC"}
+
+
+def test_failed_repair_returns_the_input_workflow(replies):
+    replies.extend(['{"off": "schema"}', "not json"])
+    assert asyncio.run(ai_service.validate_with_ai("p", ORIGINAL)) is ORIGINAL
+
+
+def test_local_validate_flags_structural_errors():
+    link = {"node": "A", "type": "main", "index": 0}
+    workflow = {
+        "name": "",
+        "nodes": [{"name": "A", "type": "t"}, {"name": "A", "type": "t"}, {"name": "B", "type": "t"}],
+        "connections": {"A": {"main": [[{**link, "node": "B"}]]}, "B": {"main": [[link]]}},
+    }
+    ok, errors = ai_service.local_validate(workflow)
+    assert not ok
+    assert errors == [
+        "missing workflow 'name'",
+        "duplicate node name 'A'",
+        "connections reference unknown nodes, self-loops, or cycles",
+    ]
+    assert ai_service.local_validate({"name": "W", "nodes": []}) == (False, ["missing or empty 'nodes'"])
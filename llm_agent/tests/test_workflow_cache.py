@@ -0,0 +1,54 @@
+import asyncio
+
+from app.services import ai_service
+from app.services.cache_service import MemoryCacheBackend, TieredCache
+from tests.conftest import wire_node
+
+WORKFLOW = {"name": "W", "nodes": [{"name": "A", "type": "n8n-nodes-base.set"}], "connections": {}}
+
+
+def test_tiered_cache_backfills_faster_tiers():
+    fast, slow = MemoryCacheBackend(), MemoryCacheBackend()
+    cache = TieredCache([fast, slow])
+
+    async def run():
+        await slow.set("k", WORKFLOW)
+        assert await fast.get("k") is None
+        assert await cache.get("k") == WORKFLOW
+        assert await fast.get("k") == WORKFLOW
+        assert await cache.get("missing") is None
+
+    asyncio.run(run())
+    assert cache.stats == {"hits": 1, "misses": 1, "hits_MemoryCacheBackend": 1}
+
+
+def test_tiered_cache_set_writes_every_tier():
+    fast, slow = MemoryCacheBackend(), MemoryCacheBackend()
+
+    async def run():
+        await TieredCache([fast, slow]).set("k", WORKFLOW)
+        return await fast.get("k"), await slow.get("k")
+
+    assert asyncio.run(run()) == (WORKFLOW, WORKFLOW)
+
+
+def test_cache_writes_run_after_the_result_is_returned(monkeypatch, stream_workflow):
+    stream_workflow({"name": "W", "nodes": [wire_node("A")], "connections": []})
+    release = asyncio.Event()
+    stored = []
+
+    async def store(prompt, embedding, workflow_json):
+        await release.wait()
+        stored.append(workflow_json)
+
+    monkeypatch.setattr(ai_service, "_store_workflow", store)
+
+    async def run():
+        result = await ai_service._run_generation_pipeline("p")
+        assert stored == [] and len(ai_service._background_writes) == 1
+        release.set()
+        await asyncio.gather(*ai_service._background_writes)
+        return result
+
+    assert stored == [asyncio.run(run())]
+    assert ai_service._background_writes == set()